@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Benchmark of JSON backends on a large synthetic course syllabus (the
+onDemandCourseMaterials.v2 reply parsed by the extractor) and on the
+parsed modules structure written by spit_json and the syllabus cache.
+
+Usage:
+  python benchmarks/bench_json.py [--modules N] [--repeat N]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from coursera import jsoncodec  # noqa: E402
+
+
+def make_syllabus(n_modules, n_lessons, n_items):
+    modules, lessons, items = [], [], []
+    for m in range(n_modules):
+        lesson_ids = []
+        for l in range(n_lessons):
+            lesson_id = 'lesson%03d%03d' % (m, l)
+            item_ids = []
+            for i in range(n_items):
+                item_id = 'item%03d%03d%03d' % (m, l, i)
+                item_ids.append(item_id)
+                items.append({
+                    'id': item_id,
+                    'name': 'Item %d of lesson %d – week %d' % (i, l, m),
+                    'slug': 'item-%d-%d-%d' % (m, l, i),
+                    'lessonId': lesson_id,
+                    'moduleId': 'module%03d' % m,
+                    'timeCommitment': 600000,
+                    'contentSummary': {
+                        'typeName': 'lecture',
+                        'definition': {'duration': 612345,
+                                       'hasInVideoAssessment': False,
+                                       'assets': ['asset%d' % i]}
+                    },
+                    'isLocked': False,
+                    'trackId': 'core'
+                })
+            lessons.append({'id': lesson_id, 'name': 'Lesson %d' % l,
+                            'slug': 'lesson-%d' % l, 'itemIds': item_ids,
+                            'moduleId': 'module%03d' % m})
+            lesson_ids.append(lesson_id)
+        modules.append({'id': 'module%03d' % m, 'name': 'Week %d' % m,
+                        'slug': 'week-%d' % m, 'lessonIds': lesson_ids})
+    return {'elements': [{'id': 'course', 'slug': 'course'}],
+            'linked': {'onDemandCourseMaterialModules.v1': modules,
+                       'onDemandCourseMaterialLessons.v1': lessons,
+                       'onDemandCourseMaterialItems.v2': items}}
+
+
+def make_parsed_modules(syllabus):
+    return [[module['slug'], [
+        [lesson_id, [
+            ['item-%s' % n, {'mp4': [['https://cdn.example.org/%s.mp4' % n,
+                                      '']],
+                             'pdf': [['https://cdn.example.org/%s.pdf' % n,
+                                      'slides', {'kind': 'assets.v1',
+                                                 'asset_id': n,
+                                                 'expires': 1454371200000}]]}]
+            for n in range(5)]]
+        for lesson_id in module['lessonIds']]]
+        for module in syllabus['linked']['onDemandCourseMaterialModules.v1']]
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--modules', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    syllabus = make_syllabus(args.modules, 10, 12)
+    page = json.dumps(syllabus)
+    parsed = make_parsed_modules(syllabus)
+
+    print('syllabus reply: %.1f MB, JSON backend in use: %s' % (
+        len(page) / 1e6, jsoncodec.BACKEND))
+
+    backends = [('json', json.loads,
+                 lambda obj: json.dumps(obj, indent=4))]
+    try:
+        import ujson
+        backends.append(('ujson', ujson.loads,
+                         lambda obj: ujson.dumps(obj, indent=4)))
+    except ImportError:
+        pass
+    try:
+        import orjson
+        backends.append(('orjson', orjson.loads,
+                         lambda obj: orjson.dumps(
+                             obj, option=orjson.OPT_INDENT_2)))
+    except ImportError:
+        pass
+
+    print('%-8s %12s %12s %12s' % ('backend', 'parse reply', 'dump reply',
+                                   'dump parsed'))
+    for name, loads, dumps in backends:
+        print('%-8s %10.1fms %10.1fms %10.1fms' % (
+            name,
+            1000 * best_of(args.repeat, lambda: loads(page)),
+            1000 * best_of(args.repeat, lambda: dumps(syllabus)),
+            1000 * best_of(args.repeat, lambda: dumps(parsed))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Benchmark of MarkupToHTMLConverter on large generated CML documents,
+compared with the previous converter that renamed tags with one
+`while soup.find(...)` loop per tag type. Both converters must produce
+the same HTML.
+
+Usage:
+  python benchmarks/bench_markup.py [--blocks N ...] [--repeat N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests  # noqa: E402
+
+from coursera.api import MarkupToHTMLConverter  # noqa: E402
+
+
+class LegacyMarkupToHTMLConverter(MarkupToHTMLConverter):
+    """
+    Tag conversion as it was done before the single-pass converter: every
+    loop rescans the document from the root.
+    """
+
+    def __call__(self, markup):
+        from coursera.utils import BeautifulSoup
+        from coursera.define import (INSTRUCTIONS_HTML_INJECTION_PRE,
+                                     INSTRUCTIONS_HTML_INJECTION_AFTER)
+
+        soup = BeautifulSoup(markup)
+        meta = soup.new_tag('meta', charset='UTF-8')
+        soup.insert(0, meta)
+        css = "".join([
+            INSTRUCTIONS_HTML_INJECTION_PRE,
+            self._mathjax_cdn_url,
+            INSTRUCTIONS_HTML_INJECTION_AFTER])
+        soup.append(BeautifulSoup(css))
+
+        while soup.find('text'):
+            soup.find('text').name = 'p'
+        while soup.find('heading'):
+            heading = soup.find('heading')
+            heading.name = 'h%s' % heading.attrs.get('level', '1')
+        while soup.find('code'):
+            soup.find('code').name = 'pre'
+        while soup.find('list'):
+            list_ = soup.find('list')
+            type_ = list_.attrs.get('bullettype', 'numbers')
+            list_.name = 'ol' if type_ == 'numbers' else 'ul'
+
+        return soup.prettify()
+
+
+def make_cml(blocks):
+    parts = ['<co-content>']
+    for i in range(blocks):
+        parts.append('<heading level="%d">Section %d</heading>' % (
+            i % 3 + 1, i))
+        parts.append('<text>Paragraph %d with <strong>bold</strong> and '
+                     '<a href="https://example.org/%d">a link</a>.</text>'
+                     % (i, i))
+        parts.append('<list bulletType="%s"><li><text>first</text></li>'
+                     '<li><text>second</text></li></list>'
+                     % ('numbers' if i % 2 else 'bullets'))
+        parts.append('<code language="python">print(%d)</code>' % i)
+        parts.append('<table><tr><td><text>%d</text></td>'
+                     '<td><text>cell</text></td></tr></table>' % i)
+    parts.append('</co-content>')
+    return ''.join(parts)
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--blocks', type=int, nargs='+',
+                        default=[25, 100, 400])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    converter = MarkupToHTMLConverter(session)
+    legacy = LegacyMarkupToHTMLConverter(session)
+
+    print('%8s %8s %12s %12s %8s' % ('blocks', 'tags', 'legacy',
+                                     'single-pass', 'speedup'))
+    for blocks in args.blocks:
+        markup = make_cml(blocks)
+        assert converter(markup) == legacy(markup), 'outputs differ'
+
+        legacy_time = best_of(args.repeat, lambda: legacy(markup))
+        new_time = best_of(args.repeat, lambda: converter(markup))
+        print('%8d %8d %10.1fms %10.1fms %7.1fx' % (
+            blocks, markup.count('</'), 1000 * legacy_time,
+            1000 * new_time, legacy_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of quiz/exam rendering on a synthetic large exam: the
+previous QuizExamToMarkupConverter that parsed and pretty-printed every
+answer option separately versus the converter that builds the whole quiz
+as a single document. Rendered pages must have the same text content.
+
+Usage:
+  python benchmarks/bench_quiz.py [--questions N] [--options N] [--repeat N]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests  # noqa: E402
+
+from coursera.api import (QuizExamToMarkupConverter,  # noqa: E402
+                          MarkupToHTMLConverter)
+from coursera.utils import BeautifulSoup, unescape_html  # noqa: E402
+
+
+class LegacyQuizExamToMarkupConverter(QuizExamToMarkupConverter):
+    """
+    Option conversion as it was done before: one parser run and one
+    pretty-print per answer option.
+    """
+
+    def __call__(self, quiz_or_exam_json):
+        return '\n'.join(self._convert(quiz_or_exam_json))
+
+    def _convert_options(self, question_index, options, input_type):
+        if not options:
+            return []
+
+        result = ['<form>']
+        for option in options:
+            option_text = unescape_html(
+                option['display']['definition']['value'])
+            soup = BeautifulSoup(option_text)
+            while soup.find('text'):
+                soup.find('text').name = 'span'
+            result.append('<label><input type="%s" name="%s">'
+                          '%s<br></label>' % (
+                              input_type, question_index, soup.prettify()))
+        result.append('</form>')
+        return result
+
+
+def make_exam(questions, options):
+    return {'questions': [{
+        'question': {'type': ('mcq', 'checkbox', 'singleNumeric')[q % 3]},
+        'variant': {'definition': {
+            'prompt': {'definition': {'value': (
+                '<co-content><text>Question %d: which of the following '
+                'is <strong>true</strong> about $$x_%d$$?</text>'
+                '<code language="python">x = %d</code></co-content>'
+                % (q, q, q))}},
+            'options': [{'display': {'definition': {'value': (
+                '<co-content><text>Option %d of question %d &amp; '
+                '<em>more</em></text></co-content>' % (o, q))}}}
+                for o in range(options)]}}}
+        for q in range(questions)]}
+
+
+def text_content(html):
+    return re.sub(r'\s+', ' ', BeautifulSoup(html).get_text()).strip()
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--options', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    exam = make_exam(args.questions, args.options)
+    render = MarkupToHTMLConverter(session)
+    legacy = LegacyQuizExamToMarkupConverter(session)
+    converter = QuizExamToMarkupConverter(session)
+
+    legacy_html = render(legacy(exam))
+    new_html = render(converter.to_document(exam))
+    assert text_content(legacy_html) == text_content(new_html), \
+        'rendered quizzes differ'
+
+    legacy_time = best_of(args.repeat, lambda: render(legacy(exam)))
+    new_time = best_of(args.repeat,
+                       lambda: render(converter.to_document(exam)))
+    print('%d questions x %d options' % (args.questions, args.options))
+    print('legacy:      %8.1fms' % (1000 * legacy_time))
+    print('single pass: %8.1fms (%.1fx)' % (1000 * new_time,
+                                             legacy_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
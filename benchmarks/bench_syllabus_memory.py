@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Memory benchmark of the parsed syllabus passed from the extractor to the
+downloader: the nested tuples, lists and dictionaries used before versus
+the slotted syllabus model (coursera.syllabus), on a synthetic
+specialization with tens of thousands of resources. Also checks that the
+model survives a round trip through its serialization format.
+
+Usage:
+  python benchmarks/bench_syllabus_memory.py [--courses N]
+"""
+
+import os
+import gc
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from coursera import syllabus  # noqa: E402
+
+HOSTS = ['https://d3c33hcgiwev3.cloudfront.net',
+         'https://d18ky98rnyall9.cloudfront.net',
+         'https://api.coursera.org']
+
+
+def make_links(course, lecture):
+    """
+    Links of one lecture as the extractor returns them. Strings are built
+    at run time like the ones parsed from API replies, so equal values are
+    distinct objects.
+    """
+    def url(index, name):
+        return '%s/%s/lecture%05d/%s' % (HOSTS[index % len(HOSTS)], course,
+                                         lecture, name)
+
+    def fmt(name):
+        return name.rsplit('.', 1)[1]
+
+    links = {
+        fmt('video.mp4'): [(url(0, 'video.mp4?Expires=1600000000&Signature='
+                                   'abcdefghijklmnopqrstuvwxyz0123456789'),
+                            '')],
+        'en.srt': [(url(2, 'subtitles.srt'), '')],
+        'en.txt': [(url(2, 'transcript.txt'), '')],
+        fmt('slides.pdf'): [(url(1, 'slides.pdf'), 'slides',
+                             {'kind': 'assets.v1',
+                              'asset_id': 'asset%05d' % lecture,
+                              'expires': 1600000000000})],
+    }
+    if lecture % 3 == 0:
+        links[fmt('notes.zip')] = [(url(1, 'notes%d.zip' % n),
+                                    'notes %d' % n) for n in range(3)]
+    return links
+
+
+def iter_course(course, modules, sections, lectures):
+    number = 0
+    for module in range(modules):
+        section_list = []
+        for section in range(sections):
+            lecture_list = []
+            for _ in range(lectures):
+                lecture_list.append(('lecture-%05d' % number,
+                                     make_links(course, number)))
+                number += 1
+            section_list.append(('section-%02d' % section, lecture_list))
+        yield 'week-%02d' % module, section_list
+
+
+def build_legacy(courses):
+    return [[module
+             for module in iter_course('course%02d' % course, 6, 5, 12)]
+            for course in range(courses)]
+
+
+def build_model(courses):
+    return [[syllabus.Module(module_slug, [
+        syllabus.Section(section_slug, [
+            syllabus.Lecture.from_links(lecture_slug, links)
+            for lecture_slug, links in lectures])
+        for section_slug, lectures in sections])
+        for module_slug, sections in iter_course('course%02d' % course,
+                                                 6, 5, 12)]
+        for course in range(courses)]
+
+
+def measure(build, courses):
+    gc.collect()
+    tracemalloc.start()
+    result = build(courses)
+    gc.collect()
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--courses', type=int, default=20)
+    args = parser.parse_args()
+
+    legacy, legacy_size = measure(build_legacy, args.courses)
+    model, model_size = measure(build_model, args.courses)
+
+    resources = sum(len(lecture.resources)
+                    for course in model for module in course
+                    for section in module.sections
+                    for lecture in section.lectures)
+    print('%d courses, %d resources' % (args.courses, resources))
+    print('nested tuples/dicts: %8.1f MB (%d bytes per resource)' % (
+        legacy_size / 1e6, legacy_size // resources))
+    print('slotted model:       %8.1f MB (%d bytes per resource, %.0f%%)' % (
+        model_size / 1e6, model_size // resources,
+        100.0 * model_size / legacy_size))
+
+    for course_legacy, course_model in zip(legacy, model):
+        restored = syllabus.from_json(json.loads(json.dumps(
+            syllabus.to_json(course_model))))
+        as_legacy = [(module.slug,
+                      [(section.slug,
+                        [(lecture.slug, lecture.links())
+                         for lecture in section.lectures])
+                       for section in module.sections])
+                     for module in restored]
+        assert as_legacy == course_legacy, 'serialization round trip differs'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Conformance check and benchmark of the HTML parser backends supported by
+coursera.utils.BeautifulSoup. Every installed parser must produce the same
+rendered HTML, extracted links and asset tags as the reference parser
+(html.parser) on a corpus of CML documents: samples from coursera/define.py,
+generated supplements and rendered quizzes.
+
+Usage:
+  python benchmarks/check_html_parsers.py [--repeat N]
+
+Exits with status 1 if a parser does not conform.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import requests  # noqa: E402
+from bs4.builder import builder_registry  # noqa: E402
+
+from coursera import utils  # noqa: E402
+from coursera.api import (CourseraOnDemand, MarkupToHTMLConverter,  # noqa
+                          QuizExamToMarkupConverter)
+
+DEFINE_PY = os.path.join(os.path.dirname(__file__), '..', 'coursera',
+                         'define.py')
+
+
+def sample_documents():
+    """
+    CML documents quoted in the sample responses of coursera/define.py.
+    """
+    with open(DEFINE_PY, encoding='utf-8') as file_object:
+        text = file_object.read()
+    return [json.loads('"%s"' % value) for value in re.findall(
+        r'"value": "(<co-content>.*?)"\s*$', text, re.MULTILINE)]
+
+
+def supplement_document(index):
+    return (
+        '<co-content>'
+        '<heading level="2">Week %(i)d readings</heading>'
+        '<text>Read <a href="https://example.org/w%(i)d/notes.pdf">the '
+        'notes</a> and <a href="https://example.org/w%(i)d/data.csv?x=1">'
+        'the data</a>, see also <a href="https://example.org/">the site'
+        '</a>.</text>'
+        '<asset id="asset%(i)d" name="slides %(i)d" extension="pdf" '
+        'assetType="generic"/>'
+        '<text>After the asset</text>'
+        '<list bulletType="bullets"><li><text>one</text></li>'
+        '<li><text>two <code>x &lt; y</code></text></li></list>'
+        '<img src="https://example.org/w%(i)d/figure.png" alt="fig"/>'
+        '<table><tr><th><text>a</text></th><td><text>b</text></td></tr>'
+        '</table>'
+        '</co-content>' % {'i': index})
+
+
+def quiz_json(index):
+    return {'questions': [{
+        'question': {'type': question_type},
+        'variant': {'definition': {
+            'prompt': {'definition': {'value': (
+                '<co-content><text>Question %d about '
+                '<strong>%s</strong>?</text></co-content>' % (
+                    index, question_type))}},
+            'options': [{'display': {'definition': {'value': (
+                '<co-content><text>Option %d</text></co-content>' % n)}}}
+                for n in range(4)]}}}
+        for question_type in ('mcq', 'checkbox', 'singleNumeric')]}
+
+
+def corpus():
+    documents = sample_documents()
+    documents.extend(supplement_document(i) for i in range(20))
+    quiz_converter = QuizExamToMarkupConverter(requests.Session())
+    documents.extend(quiz_converter(quiz_json(i)) for i in range(20))
+    return documents
+
+
+def process(documents):
+    """
+    Run every document through link extraction, asset tag extraction and
+    HTML rendering with the currently selected parser.
+    """
+    session = requests.Session()
+    course = CourseraOnDemand(session, 'course-id', 'course-name')
+    render = MarkupToHTMLConverter(session)
+    return [(course._extract_links_from_a_tags_in_text(document),
+             course._extract_asset_tags(document),
+             render(document))
+            for document in documents]
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    documents = corpus()
+    parsers = [name for name in utils.HTML_PARSERS
+               if builder_registry.lookup(name) is not None]
+    if 'lxml' in parsers:
+        parsers.append('auto')
+    print('%d documents, installed parsers: %s' % (
+        len(documents), ', '.join(parsers)))
+    print('%-12s %10s %10s' % ('parser', 'parse', 'process'))
+
+    utils.set_html_parser('html.parser')
+    reference = process(documents)
+
+    failed = False
+    for name in parsers:
+        utils.set_html_parser(name)
+        results = process(documents)
+        mismatches = [index for index, (expected, actual)
+                      in enumerate(zip(reference, results))
+                      if expected != actual]
+
+        print('%-12s %8.1fms %8.1fms  %s' % (
+            name,
+            1000 * best_of(args.repeat, lambda: [
+                utils.BeautifulSoup(document) for document in documents]),
+            1000 * best_of(args.repeat, lambda: process(documents)),
+            'conforms' if not mismatches else
+            'DIFFERS on documents %s' % mismatches))
+        failed = failed or bool(mismatches)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
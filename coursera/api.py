@@ -8,24 +8,32 @@ import os
 import re
 import json
 import base64
+import contextlib
+import hashlib
 import logging
+import mimetypes
+import threading
 import time
 import requests
 import urllib
 
 from collections import namedtuple, OrderedDict
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlparse, parse_qs
 import attr
 
 from .utils import (BeautifulSoup, make_coursera_absolute_url,
                     extend_supplement_links, clean_url, clean_filename,
-                    is_debug_run, unescape_html)
+                    is_debug_run, unescape_html, mkdir_p)
 from .network import get_reply, get_page, post_page_and_reply
+from .notebook import NotebookSync
+from .parallel import budgeted, map_ordered, ConcurrencyBudget
 from .define import (OPENCOURSE_SUPPLEMENT_URL,
                      OPENCOURSE_PROGRAMMING_ASSIGNMENTS_URL,
                      OPENCOURSE_ASSET_URL,
                      OPENCOURSE_ASSETS_URL,
                      OPENCOURSE_API_ASSETS_V1_URL,
+                     OPENCOURSE_API_ASSETS_V1_MAX_URL_LENGTH,
+                     SIGNED_URL_EXPIRY_MARGIN,
                      OPENCOURSE_ONDEMAND_COURSE_MATERIALS,
                      OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2,
                      OPENCOURSE_ONDEMAND_COURSES_V1,
@@ -41,8 +49,6 @@ from .define import (OPENCOURSE_SUPPLEMENT_URL,
                      # New feature, Notebook (Python Jupyter)
                      OPENCOURSE_NOTEBOOK_DESCRIPTIONS,
                      OPENCOURSE_NOTEBOOK_LAUNCHES,
-                     OPENCOURSE_NOTEBOOK_TREE,
-                     OPENCOURSE_NOTEBOOK_DOWNLOAD,
 
                      POST_OPENCOURSE_API_QUIZ_SESSION,
                      POST_OPENCOURSE_API_QUIZ_SESSION_GET_STATE,
@@ -54,7 +60,8 @@ from .define import (OPENCOURSE_SUPPLEMENT_URL,
                      INSTRUCTIONS_HTML_INJECTION_AFTER,
 
                      IN_MEMORY_EXTENSION,
-                     IN_MEMORY_MARKER)
+                     IN_MEMORY_MARKER,
+                     TRANSCRIPT_MARKER)
 
 
 from .cookies import prepare_auth_headers
@@ -82,10 +89,41 @@ class QuizExamToMarkupConverter(object):
                          'regex',
                          'reflect')
 
+    # Attribute that marks labels of answer options while a quiz is built
+    OPTION_MARKER = 'data-coursera-dl-option'
+
     def __init__(self, session):
         self._session = session
 
     def __call__(self, quiz_or_exam_json):
+        """
+        Convert quiz/exam JSON into markup.
+
+        @rtype: str
+        """
+        return self.to_document(quiz_or_exam_json).soup.decode()
+
+    def to_document(self, quiz_or_exam_json):
+        """
+        Convert quiz/exam JSON into a parsed markup document that can be
+        rendered by MarkupToHTMLConverter right away. The markup of all
+        questions and options is parsed once, as a single document.
+
+        @rtype: CMLDocument
+        """
+        document = CMLDocument('\n'.join(self._convert(quiz_or_exam_json)))
+
+        # We need to replace <text> with <span> in options so that answer
+        # text stays on the same line with checkbox/radio button
+        for label in document.soup.find_all(
+                'label', attrs={self.OPTION_MARKER: True}):
+            del label[self.OPTION_MARKER]
+            for text in label.find_all('text'):
+                text.name = 'span'
+
+        return document
+
+    def _convert(self, quiz_or_exam_json):
         result = []
 
         for question_index, question_json in enumerate(quiz_or_exam_json['questions']):
@@ -123,7 +161,7 @@ class QuizExamToMarkupConverter(object):
 
             result.append('<hr>')
 
-        return '\n'.join(result)
+        return result
 
     def _convert_options(self, question_index, options, input_type):
         if not options:
@@ -135,66 +173,244 @@ class QuizExamToMarkupConverter(object):
             option_text = unescape_html(
                 option['display']['definition']['value'])
 
-            # We need to replace <text> with <span> so that answer text
-            # stays on the same line with checkbox/radio button
-            option_text = self._replace_tag(option_text, 'text', 'span')
-            result.append('<label><input type="%s" name="%s">'
+            # Option labels are marked so that their <text> tags can be
+            # converted once the whole quiz is parsed, see to_document
+            result.append('<label %s><input type="%s" name="%s">'
                           '%s<br></label>' % (
-                              input_type, question_index, option_text))
+                              self.OPTION_MARKER, input_type,
+                              question_index, option_text))
 
         result.append('</form>')
         return result
 
-    def _replace_tag(self, text, initial_tag, target_tag):
-        soup = BeautifulSoup(text)
-        while soup.find(initial_tag):
-            soup.find(initial_tag).name = target_tag
-        return soup.prettify()
-
     def _generate_input_field(self):
         return ['<form><label>Enter answer here:<input type="text" '
                 'name=""><br></label></form>']
 
 
+# Tags of instructions markup that have HTML equivalents: markup tag name =>
+# function that returns the HTML tag name for a tag
+_MARKUP_TAG_MAP = {
+    'text': lambda tag: 'p',
+    'heading': lambda tag: 'h%s' % tag.attrs.get('level', '1'),
+    'code': lambda tag: 'pre',
+    'list': lambda tag: (
+        'ol' if tag.attrs.get('bullettype', 'numbers') == 'numbers'
+        else 'ul'),
+}
+
+
+class CMLDocument(object):
+    """
+    Instructions markup (CML) parsed once and shared by link extraction,
+    asset tag extraction and HTML rendering. Rendering converts the parsed
+    tree in place, so it has to be the last use of the document.
+    """
+
+    def __init__(self, markup):
+        """
+        @param markup: Instructions markup.
+        @type markup: str
+        """
+        self._soup = BeautifulSoup(markup)
+
+    @staticmethod
+    def of(markup):
+        """
+        Return markup as a CMLDocument, parsing it if necessary.
+
+        @param markup: Instructions markup or parsed document.
+        @type markup: str or CMLDocument
+
+        @rtype: CMLDocument
+        """
+        if isinstance(markup, CMLDocument):
+            return markup
+        return CMLDocument(markup)
+
+    @property
+    def soup(self):
+        """
+        Parsed tree of the document.
+
+        @rtype: BeautifulSoup
+        """
+        if self._soup is None:
+            raise ValueError('CML document has already been rendered')
+        return self._soup
+
+    def detach(self):
+        """
+        Hand the parsed tree over for in-place conversion. The document
+        cannot be used afterwards.
+
+        @rtype: BeautifulSoup
+        """
+        soup = self.soup
+        self._soup = None
+        return soup
+
+
+class SidecarAssetStore(object):
+    """
+    Stores assets referenced by instructions markup (images, audio) as
+    sidecar files instead of inlining them into the HTML. Assets are
+    streamed into a course-wide directory and named by the SHA-1 of their
+    contents, so identical assets are stored once per course. Rendered
+    pages reference them by a path relative to the section directory.
+    """
+
+    def __init__(self, session, path, url_prefix='../../_assets'):
+        """
+        @param session: Requests session.
+        @type session: requests.Session
+
+        @param path: Directory that holds asset files of the course.
+        @type path: str
+
+        @param url_prefix: Path of that directory relative to the
+            directories of rendered pages.
+        @type url_prefix: str
+        """
+        self._session = session
+        self._path = path
+        self._url_prefix = url_prefix
+        self._lock = threading.Lock()
+        self._stored = {}
+
+    def __call__(self, asset):
+        """
+        Store an asset file (once per asset id).
+
+        @param asset: Asset resolved without data.
+        @type asset: Asset
+
+        @return: Tuple of (relative URL, content type) or None if the asset
+            could not be downloaded.
+        @rtype: (str, str)
+        """
+        with self._lock:
+            if asset.id in self._stored:
+                return self._stored[asset.id]
+
+        try:
+            stored = self._download(asset)
+        except (requests.exceptions.RequestException, IOError, OSError) as e:
+            logging.warning('Could not store asset %s: %s', asset.name, e)
+            return None
+
+        with self._lock:
+            self._stored[asset.id] = stored
+        return stored
+
+    def _download(self, asset):
+        mkdir_p(self._path)
+        tmp_filename = os.path.join(self._path, '.%s.%d.tmp' % (
+            asset.id, threading.get_ident()))
+        digest = hashlib.sha1()
+
+        reply = self._session.get(asset.url, stream=True)
+        try:
+            reply.raise_for_status()
+            content_type = reply.headers.get('Content-Type')
+            with open(tmp_filename, 'wb') as file_object:
+                for chunk in reply.iter_content(chunk_size=1048576):
+                    digest.update(chunk)
+                    file_object.write(chunk)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+            raise
+        finally:
+            reply.close()
+
+        filename = digest.hexdigest() + self._extension(asset, content_type)
+        os.replace(tmp_filename, os.path.join(self._path, filename))
+        logging.debug('Stored asset %s as %s', asset.name, filename)
+
+        return '%s/%s' % (self._url_prefix, filename), content_type
+
+    def _extension(self, asset, content_type):
+        extension = os.path.splitext(asset.name)[1]
+        if not extension and content_type:
+            extension = mimetypes.guess_extension(
+                content_type.split(';')[0].strip()) or ''
+        return re.sub(r'[^a-z0-9.]', '', extension.lower())
+
+
 class MarkupToHTMLConverter(object):
-    def __init__(self, session, mathjax_cdn_url=None):
+    def __init__(self, session, mathjax_cdn_url=None, sidecar_store=None):
+        """
+        @param sidecar_store: Store of asset files. If given, assets are
+            saved as sidecar files and referenced by relative paths
+            instead of being inlined base64-encoded.
+        @type sidecar_store: SidecarAssetStore
+        """
         self._session = session
         self._asset_retriever = AssetRetriever(session)
         if not mathjax_cdn_url:
             mathjax_cdn_url = INSTRUCTIONS_HTML_MATHJAX_URL
         self._mathjax_cdn_url = mathjax_cdn_url
+        self._sidecar_store = sidecar_store
 
     def __call__(self, markup):
         """
         Convert instructions markup to make it more suitable for
         offline reading.
 
-        @param markup: HTML (kinda) markup to prettify.
-        @type markup: str
+        @param markup: HTML (kinda) markup to prettify. A parsed document
+            is converted in place and cannot be used afterwards.
+        @type markup: str or CMLDocument
 
         @return: Prettified HTML with several markup tags replaced with HTML
             equivalents.
         @rtype: str
         """
-        soup = BeautifulSoup(markup)
-        self._convert_markup_basic(soup)
-        self._convert_markup_images(soup)
-        self._convert_markup_audios(soup)
+        soup = CMLDocument.of(markup).detach()
+        images, audios = self._convert_markup_tags(soup)
+        self._inject_markup_style(soup)
+        self._convert_markup_assets(soup, images, audios)
         return soup.prettify()
 
-    def _convert_markup_basic(self, soup):
+    def _convert_markup_tags(self, soup):
+        """
+        Replace textual markup tags with their HTML equivalents (see
+        _MARKUP_TAG_MAP) and collect image and audio assets, all in a
+        single traversal of the document.
+
+        @param soup: BeautifulSoup instance.
+        @type soup: BeautifulSoup
+
+        @return: Tuple of <img> tags and <asset> audio tags that reference
+            assets.
+        @rtype: ([bs4.Tag], [bs4.Tag])
+        """
+        images, audios = [], []
+
+        for tag in soup.find_all(True):
+            rename = _MARKUP_TAG_MAP.get(tag.name)
+            if rename is not None:
+                tag.name = rename(tag)
+            elif tag.name == 'img':
+                if tag.attrs.get('assetid') is not None:
+                    images.append(tag)
+            elif tag.name == 'asset':
+                if tag.attrs.get('id') is not None \
+                        and tag.attrs.get('assettype') == 'audio':
+                    audios.append(tag)
+
+        return images, audios
+
+    def _inject_markup_style(self, soup):
         """
-        Perform basic conversion of instructions markup. This includes
-        replacement of several textual markup tags with their HTML equivalents.
+        Inject meta charset tag, basic CSS style and MathJax script.
 
         @param soup: BeautifulSoup instance.
         @type soup: BeautifulSoup
         """
-        # Inject meta charset tag
         meta = soup.new_tag('meta', charset='UTF-8')
         soup.insert(0, meta)
 
-        # 1. Inject basic CSS style
         css = "".join([
             INSTRUCTIONS_HTML_INJECTION_PRE,
             self._mathjax_cdn_url,
@@ -202,86 +418,74 @@ class MarkupToHTMLConverter(object):
         css_soup = BeautifulSoup(css)
         soup.append(css_soup)
 
-        # 2. Replace <text> with <p>
-        while soup.find('text'):
-            soup.find('text').name = 'p'
-
-        # 3. Replace <heading level="1"> with <h1>
-        while soup.find('heading'):
-            heading = soup.find('heading')
-            heading.name = 'h%s' % heading.attrs.get('level', '1')
-
-        # 4. Replace <code> with <pre>
-        while soup.find('code'):
-            soup.find('code').name = 'pre'
-
-        # 5. Replace <list> with <ol> or <ul>
-        while soup.find('list'):
-            list_ = soup.find('list')
-            type_ = list_.attrs.get('bullettype', 'numbers')
-            list_.name = 'ol' if type_ == 'numbers' else 'ul'
-
-    def _convert_markup_images(self, soup):
+    def _convert_markup_assets(self, soup, images, audios):
         """
-        Convert images of instructions markup. Images are downloaded,
-        base64-encoded and inserted into <img> tags.
+        Replace image and audio assets with their actual contents. Assets
+        are downloaded (information about all of them with a single bulk
+        request), base64-encoded and inserted into <img> tags and
+        <audio controls> <source> tags respectively.
 
         @param soup: BeautifulSoup instance.
         @type soup: BeautifulSoup
-        """
-        # 6. Replace <img> assets with actual image contents
-        images = [image for image in soup.find_all('img')
-                  if image.attrs.get('assetid') is not None]
-        if not images:
-            return
 
-        # Get assetid attribute from all images
-        asset_ids = [image.attrs.get('assetid') for image in images]
-        self._asset_retriever(asset_ids)
+        @param images: <img> tags with `assetid` attribute.
+        @type images: [bs4.Tag]
 
-        for image in images:
-            # Encode each image using base64
-            asset = self._asset_retriever[image['assetid']]
-            if asset.data is not None:
-                encoded64 = base64.b64encode(asset.data).decode()
-                image['src'] = 'data:%s;base64,%s' % (
-                    asset.content_type, encoded64)
-
-    def _convert_markup_audios(self, soup):
-        """
-        Convert audios of instructions markup. Audios are downloaded,
-        base64-encoded and inserted as <audio controls> <source> tag.
-
-        @param soup: BeautifulSoup instance.
-        @type soup: BeautifulSoup
+        @param audios: <asset> tags of audio assets.
+        @type audios: [bs4.Tag]
         """
-        # 7. Replace <asset> audio assets with actual audio contents
-        audios = [audio for audio in soup.find_all('asset')
-                  if audio.attrs.get('id') is not None
-                  and audio.attrs.get('assettype') == 'audio']
-        if not audios:
+        if not images and not audios:
             return
 
-        # Get assetid attribute from all audios
-        asset_ids = [audio.attrs.get('id') for audio in audios]
-        self._asset_retriever(asset_ids)
+        asset_ids = ([image['assetid'] for image in images] +
+                     [audio['id'] for audio in audios])
+        # Keep references to the retrieved assets, their payloads may be
+        # evicted from the asset cache in the meantime
+        assets = dict((asset.id, asset) for asset in self._asset_retriever(
+            asset_ids, download=self._sidecar_store is None))
 
-        for audio in audios:
-            # Encode each audio using base64
-            asset = self._asset_retriever[audio['id']]
-            if asset.data is not None:
-                encoded64 = base64.b64encode(asset.data).decode()
-                data_string = 'data:%s;base64,%s' % (
-                    asset.content_type, encoded64)
+        for image in images:
+            source = self._get_asset_source(assets.get(image['assetid']))
+            if source is not None:
+                image['src'] = source[0]
 
+        for audio in audios:
+            source = self._get_asset_source(assets.get(audio['id']))
+            if source is not None:
+                src, content_type = source
                 source_tag = soup.new_tag(
-                    'source', src=data_string, type=asset.content_type)
+                    'source', src=src, type=content_type)
                 controls_tag = soup.new_tag('audio', controls="")
                 controls_tag.string = 'Your browser does not support the audio element.'
 
                 controls_tag.append(source_tag)
                 audio.insert_after(controls_tag)
 
+    def _get_asset_source(self, asset):
+        """
+        Return the source of an asset: either the relative path of its
+        sidecar file or its base64-encoded contents.
+
+        @param asset: Retrieved asset or None.
+        @type asset: Asset
+
+        @return: Tuple of (URL, content type) or None if the asset is not
+            available.
+        @rtype: (str, str)
+        """
+        if asset is None:
+            return None
+
+        if self._sidecar_store is not None:
+            return self._sidecar_store(asset)
+
+        if asset.data is None:
+            return None
+
+        encoded64 = base64.b64encode(asset.data).decode()
+        return ('data:%s;base64,%s' % (asset.content_type, encoded64),
+                asset.content_type)
+
 
 class OnDemandCourseMaterialItemsV1(object):
     """
@@ -352,9 +556,12 @@ class OnDemandCourseMaterialItemsV1(object):
         return self._items.get(lesson_id)
 
 
-class Asset(namedtuple('Asset', 'id name type_name url content_type data')):
+class Asset(namedtuple('Asset',
+                       'id name type_name url content_type data expires')):
     """
-    This class contains information about an asset.
+    This class contains information about an asset. `expires` is the
+    expiration time of the signed `url` in milliseconds since the epoch
+    (or None if unknown).
     """
     __slots__ = ()
 
@@ -363,55 +570,543 @@ class Asset(namedtuple('Asset', 'id name type_name url content_type data')):
             self.id, self.name, self.type_name, self.url, self.content_type)
 
 
+def _split_ids(ids, url, quote=False):
+    """
+    Split unique ids into chunks that fit into a single bulk request URL
+    (@see OPENCOURSE_API_ASSETS_V1_MAX_URL_LENGTH).
+
+    @param ids: List of ids.
+    @type ids: [str]
+
+    @param url: URL pattern of the bulk request.
+    @type url: str
+
+    @param quote: Flag that tells whether ids are URL-quoted in the request.
+    @type quote: bool
+
+    @return: Generator of id chunks.
+    @rtype: generator of [str]
+    """
+    separator = quote_plus(',') if quote else ','
+    base_length = len(url.format(id='', ids=''))
+    chunk, length = [], base_length
+
+    for id_ in OrderedDict.fromkeys(ids):
+        id_length = len(quote_plus(id_) if quote else id_) + len(separator)
+        if chunk and length + id_length > \
+                OPENCOURSE_API_ASSETS_V1_MAX_URL_LENGTH:
+            yield chunk
+            chunk, length = [], base_length
+        chunk.append(id_)
+        length += id_length
+
+    if chunk:
+        yield chunk
+
+
+def get_asset_urls(session, asset_ids):
+    """
+    Get signed URLs of assets referenced by <asset> tags, several assets
+    per assetUrls.v1 request. Signed URLs expire, so the replies are kept
+    out of the request and HTTP caches.
+
+    @param session: Requests session.
+    @type session: requests.Session
+
+    @param asset_ids: List of ids to get URLs for.
+    @type asset_ids: [str]
+
+    @return: List of dictionaries with asset URLs, ids and expiration
+        times (in milliseconds since the epoch, None if unknown).
+    @rtype: [{
+        'id': '<id>',
+        'url': '<url>',
+        'expires': <expires>
+    }]
+    """
+    result = []
+    for chunk in _split_ids(asset_ids, OPENCOURSE_ASSET_URL, quote=True):
+        dom = get_page(session, OPENCOURSE_ASSET_URL,
+                       json=True,
+                       cache=False,
+                       ids=quote_plus(','.join(chunk)))
+
+        result.extend({'id': element['id'],
+                       'url': element['url'].strip(),
+                       'expires': element.get('expires')}
+                      for element in dom['elements'])
+    return result
+
+
+def make_url_expiry(kind, asset_id, expires):
+    """
+    Build the expiry record that is stored as the third element of a link
+    tuple whose URL is signed, @see SignedURLRefresher.
+
+    @param kind: API the URL was resolved with: 'assets.v1',
+        'assetUrls.v1' or 'onDemandLectureVideos.v1'.
+    @type kind: str
+
+    @param asset_id: Id of the asset (or video) the URL points to.
+    @type asset_id: str
+
+    @param expires: Expiration time in milliseconds since the epoch.
+    @type expires: int
+
+    @return: Expiry record or None if the expiration time is unknown.
+    @rtype: dict
+    """
+    if expires is None:
+        return None
+    return {'kind': kind, 'asset_id': asset_id, 'expires': expires}
+
+
+def get_signed_url_expires(url):
+    """
+    Return the expiration time of a CDN-signed URL, i.e. of a URL with an
+    `Expires` query parameter in seconds since the epoch.
+
+    @return: Expiration time in milliseconds since the epoch or None if
+        the URL is not signed.
+    @rtype: int
+    """
+    expires = parse_qs(urlparse(url).query).get('Expires')
+    try:
+        return int(expires[0]) * 1000 if expires else None
+    except ValueError:
+        return None
+
+
+def make_video_link(url, course_id, video_id, resolution):
+    """
+    Build the link tuple of a lecture video. Video URLs are signed by the
+    CDN, so the link carries an expiry record that allows to re-resolve
+    it through the lecture videos API, @see SignedURLRefresher.
+
+    @return: Link tuple (url, '') or (url, '', expiry).
+    @rtype: tuple
+    """
+    expiry = make_url_expiry('onDemandLectureVideos.v1', video_id,
+                             get_signed_url_expires(url))
+    if expiry is None:
+        return (url, '')
+    expiry.update(course_id=course_id, resolution=resolution)
+    return (url, '', expiry)
+
+
+class SignedURLRefresher(object):
+    """
+    Re-resolves signed asset URLs that expired since the syllabus was
+    parsed (which matters for cached syllabi and long runs). Expired URLs
+    are resolved in bulk, bypassing request caches that would return the
+    same stale URLs.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    def __call__(self, expiries):
+        """
+        @param expiries: Expiry records of links to refresh, @see
+            make_url_expiry
+        @type expiries: [dict]
+
+        @return: Mapping (kind, asset_id) => (url, expires) of refreshed
+            URLs. Assets that could not be refreshed are missing.
+        @rtype: dict
+        """
+        asset_ids = {}
+        for expiry in expiries:
+            asset_ids.setdefault(expiry['kind'], []).append(
+                expiry['asset_id'])
+
+        refreshed = {}
+        try:
+            if 'assets.v1' in asset_ids:
+                retriever = AssetRetriever(self._session)
+                for asset in retriever(asset_ids['assets.v1'],
+                                       download=False, cache=False):
+                    refreshed[('assets.v1', asset.id)] = (
+                        asset.url, asset.expires)
+
+            if 'assetUrls.v1' in asset_ids:
+                for element in get_asset_urls(self._session,
+                                              asset_ids['assetUrls.v1']):
+                    refreshed[('assetUrls.v1', element['id'])] = (
+                        element['url'], element['expires'])
+        except requests.exceptions.HTTPError as exception:
+            logging.warning('Could not refresh expired URLs: %s', exception)
+
+        # Videos have no bulk API, every lecture is requested on its own
+        for expiry in expiries:
+            if expiry['kind'] == 'onDemandLectureVideos.v1':
+                url = self._refresh_video(expiry)
+                if url is not None:
+                    refreshed[(expiry['kind'], expiry['asset_id'])] = (
+                        url, get_signed_url_expires(url))
+
+        logging.debug('Refreshed %d of %d expired URLs',
+                      len(refreshed), len(expiries))
+        return refreshed
+
+    def _refresh_video(self, expiry):
+        try:
+            dom = get_page(self._session,
+                           OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL,
+                           json=True,
+                           cache=False,
+                           course_id=expiry['course_id'],
+                           video_id=expiry['asset_id'])
+        except requests.exceptions.HTTPError as exception:
+            logging.warning('Could not refresh video %s: %s',
+                            expiry['asset_id'], exception)
+            return None
+
+        videos = VideosV1.from_json(dom['linked']['onDemandVideos.v1'][0])
+        if expiry['resolution'] in videos:
+            return videos[expiry['resolution']].mp4_video_url
+        return videos.get_best().mp4_video_url
+
+
+class AssetCache(object):
+    """
+    In-memory cache of assets shared by all AssetRetrievers of a session
+    (@see the `asset_cache` session attribute). Metadata (names and URLs)
+    and payloads (downloaded contents) are cached separately: metadata is
+    small and kept for the whole run, payloads are evicted least recently
+    used first once their total size exceeds `max_size` bytes.
+    """
+
+    def __init__(self, max_size=32 * 1024 * 1024):
+        """
+        @param max_size: Maximum total size of cached payloads in bytes.
+        @type max_size: int
+        """
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._metadata = {}
+        self._payloads = OrderedDict()
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.payload_hits = 0
+        self.payload_misses = 0
+        self.evictions = 0
+
+    def get_metadata(self, asset_id, count=True):
+        """
+        @param count: Flag that tells whether the lookup counts towards
+            hit/miss statistics.
+        @type count: bool
+
+        @return: Asset without data or None.
+        @rtype: Asset
+        """
+        with self._lock:
+            asset = self._metadata.get(asset_id)
+            if count:
+                if asset is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return asset
+
+    def put_metadata(self, asset):
+        with self._lock:
+            self._metadata[asset.id] = asset._replace(data=None,
+                                                      content_type=None)
+
+    def get_payload(self, asset_id, count=True):
+        """
+        @param count: @see get_metadata
+        @type count: bool
+
+        @return: Tuple of (data, content type) or None.
+        @rtype: (bytes, str)
+        """
+        with self._lock:
+            payload = self._payloads.get(asset_id)
+            if payload is None:
+                if count:
+                    self.payload_misses += 1
+                return None
+            self._payloads.move_to_end(asset_id)
+            if count:
+                self.payload_hits += 1
+            return payload
+
+    def put_payload(self, asset_id, data, content_type):
+        if len(data) > self._max_size:
+            return
+
+        with self._lock:
+            previous = self._payloads.pop(asset_id, None)
+            if previous is not None:
+                self._size -= len(previous[0])
+
+            self._payloads[asset_id] = (data, content_type)
+            self._size += len(data)
+
+            while self._size > self._max_size:
+                _asset_id, (evicted, _content_type) = \
+                    self._payloads.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def report(self):
+        logging.info('Asset cache: %d hits, %d misses; payloads: %d hits, '
+                     '%d misses, %d evicted, %d bytes cached',
+                     self.hits, self.misses, self.payload_hits,
+                     self.payload_misses, self.evictions, self._size)
+
+
 class AssetRetriever(object):
     """
-    This class helps download assets by their ID.
+    This class helps download assets by their ID. Assets are cached in the
+    session's AssetCache (or in a private one if the session has none).
     """
 
     def __init__(self, session):
         self._session = session
-        self._asset_mapping = {}
+        self._cache = getattr(session, 'asset_cache', None)
+        if self._cache is None:
+            self._cache = AssetCache()
 
     def __getitem__(self, asset_id):
-        return self._asset_mapping[asset_id]
+        asset = self.get(asset_id)
+        if asset is None:
+            raise KeyError(asset_id)
+        return asset
 
-    def __call__(self, asset_ids, download=True):
-        result = []
+    def get(self, asset_id, default=None):
+        """
+        Return a known asset along with its data if the data is cached.
+        """
+        asset = self._cache.get_metadata(asset_id, count=False)
+        if asset is None:
+            return default
 
-        # Download information about assets (by IDs)
-        asset_list = get_page(self._session, OPENCOURSE_API_ASSETS_V1_URL,
-                              json=True,
-                              id=','.join(asset_ids))
+        payload = self._cache.get_payload(asset_id, count=False)
+        if payload is not None:
+            asset = asset._replace(data=payload[0], content_type=payload[1])
+        return asset
 
-        # Create a map "asset_id => asset" for easier access
-        asset_map = dict((asset['id'], asset)
-                         for asset in asset_list['elements'])
+    def __call__(self, asset_ids, download=True, cache=True):
+        result = []
 
-        for asset_id in asset_ids:
-            # Download each asset
-            asset_dict = asset_map[asset_id]
+        # Download information about assets (by IDs) that are not cached
+        # yet, several assets per request. The replies carry signed URLs,
+        # so they are kept out of the request and HTTP caches: metadata
+        # rejected for expiry must come from the server.
+        missing_ids = [asset_id for asset_id in asset_ids
+                       if not cache or not self._is_usable(
+                           self._cache.get_metadata(asset_id))]
+        for chunk in _split_ids(missing_ids, OPENCOURSE_API_ASSETS_V1_URL):
+            asset_list = get_page(self._session, OPENCOURSE_API_ASSETS_V1_URL,
+                                  json=True,
+                                  cache=False,
+                                  id=','.join(chunk))
+
+            for asset_dict in asset_list['elements']:
+                self._cache.put_metadata(Asset(
+                    id=asset_dict['id'].strip(),
+                    name=asset_dict['name'].strip(),
+                    type_name=asset_dict['typeName'].strip(),
+                    url=asset_dict['url']['url'].strip(),
+                    content_type=None,
+                    data=None,
+                    expires=asset_dict['url'].get('expires')))
 
-            url = asset_dict['url']['url'].strip()
-            data, content_type = None, None
+        for asset_id in asset_ids:
+            asset = self._cache.get_metadata(asset_id, count=False)
+            if asset is None:
+                logging.warning('Asset %s is not available', asset_id)
+                continue
 
             if download:
-                reply = get_reply(self._session, url)
-                if reply.status_code == 200:
-                    data = reply.content
-                    content_type = reply.headers.get('Content-Type')
-
-            asset = Asset(id=asset_dict['id'].strip(),
-                          name=asset_dict['name'].strip(),
-                          type_name=asset_dict['typeName'].strip(),
-                          url=url,
-                          content_type=content_type,
-                          data=data)
-
-            self._asset_mapping[asset.id] = asset
+                payload = self._cache.get_payload(asset.id)
+                if payload is None:
+                    # Download each asset
+                    reply = get_reply(self._session, asset.url)
+                    if reply.status_code == 200:
+                        payload = (reply.content,
+                                   reply.headers.get('Content-Type'))
+                        self._cache.put_payload(asset.id, *payload)
+                if payload is not None:
+                    asset = asset._replace(data=payload[0],
+                                           content_type=payload[1])
+
             result.append(asset)
 
         return result
 
+    def _is_usable(self, asset):
+        """
+        Check whether cached asset metadata can be used, i.e. it exists and
+        its signed URL does not expire soon.
+        """
+        if asset is None:
+            return False
+        return asset.expires is None or \
+            asset.expires > (time.time() + SIGNED_URL_EXPIRY_MARGIN) * 1000
+
+
+class LectureAssetBatch(object):
+    """
+    Collects lecture assets of a whole course so that the URLs of
+    `asset` elements can be resolved with a few bulk assets.v1 requests
+    instead of one request per asset.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def add(self, links, entries):
+        """
+        Remember asset entries that should be added to lecture links once
+        they are resolved.
+
+        @param links: Lecture links that will be extended in place.
+        @type links: @see CourseraOnDemand._extract_links_from_text
+
+        @param entries: Asset entries, @see
+            CourseraOnDemand._get_asset_entries
+        @type entries: [dict]
+        """
+        with self._lock:
+            self._pending.append((links, entries))
+
+    def take(self):
+        """
+        Return all pending (links, entries) pairs and forget them.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+
+class ResolutionPlanner(object):
+    """
+    Picks a video resolution per lecture so that the videos of a whole
+    course fit a byte budget. Lectures are collected while the syllabus
+    is extracted; `plan` then learns the size of every candidate source
+    with concurrent HEAD requests, starts all lectures at their lowest
+    resolution and raises them one resolution step at a time, lowest
+    first, while the budget allows.
+    """
+
+    def __init__(self, session, budget, max_resolution=None, jobs=1):
+        """
+        @param session: Requests session.
+        @type session: requests.Session
+
+        @param budget: Total size of course videos in bytes.
+        @type budget: int
+
+        @param max_resolution: Highest resolution to consider, e.g. '720p'.
+            All resolutions are considered if None.
+        @type max_resolution: str
+
+        @param jobs: Number of concurrent HEAD requests.
+        @type jobs: int
+        """
+        self._session = session
+        self._budget = budget
+        self._max_resolution = max_resolution
+        self._jobs = jobs
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def add(self, links, videos):
+        """
+        Remember a lecture whose video link should be chosen by the plan.
+
+        @param links: Lecture links, the 'mp4' entry is replaced in place.
+        @type links: @see CourseraOnDemand._extract_links_from_text
+
+        @param videos: Available videos of the lecture.
+        @type videos: VideosV1
+        """
+        with self._lock:
+            self._pending.append((links, videos.up_to(self._max_resolution)))
+
+    def plan(self):
+        """
+        Choose resolutions of all lectures collected so far and update
+        their links.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        urls = list(set(video.mp4_video_url
+                        for _links, videos in pending for video in videos))
+        sizes = dict(zip(urls, map_ordered(
+            budgeted(self._session, self._get_size), urls, self._jobs)))
+
+        lectures = []
+        unknown = 0
+        for links, videos in pending:
+            candidates = [(video, sizes[video.mp4_video_url])
+                          for video in videos
+                          if sizes[video.mp4_video_url] is not None]
+            if candidates:
+                lectures.append((links, candidates))
+            else:
+                unknown += 1
+        if unknown:
+            logging.warning('Video sizes of %d lectures are unknown, their '
+                            'resolution is not planned', unknown)
+
+        choices = [0] * len(lectures)
+        total = sum(candidates[0][1] for _links, candidates in lectures)
+        if total > self._budget:
+            logging.warning('Videos do not fit the budget of %.1f MB even in '
+                            'the lowest resolution (%.1f MB)',
+                            self._budget / 1048576.0, total / 1048576.0)
+
+        heights = sorted(set(video.height
+                             for _links, candidates in lectures
+                             for video, _size in candidates))
+        for height in heights:
+            for index, (_links, candidates) in enumerate(lectures):
+                choice = choices[index]
+                if choice + 1 == len(candidates) or \
+                        candidates[choice + 1][0].height > height:
+                    continue
+                extra = candidates[choice + 1][1] - candidates[choice][1]
+                if total + extra <= self._budget:
+                    choices[index] = choice + 1
+                    total += extra
+
+        for (links, candidates), choice in zip(lectures, choices):
+            video = candidates[choice][0]
+            expiry = links['mp4'][0][2] if len(links['mp4'][0]) > 2 \
+                else None
+            if expiry is None:
+                links['mp4'] = [(video.mp4_video_url, '')]
+            else:
+                links['mp4'] = [make_video_link(
+                    video.mp4_video_url, expiry['course_id'],
+                    expiry['asset_id'], video.resolution)]
+
+        logging.info('Planned resolutions of %d lectures: %.1f MB of '
+                     '%.1f MB budget', len(lectures), total / 1048576.0,
+                     self._budget / 1048576.0)
+
+    def _get_size(self, url):
+        try:
+            reply = self._session.head(url, allow_redirects=True)
+            reply.raise_for_status()
+            return int(reply.headers['Content-Length'])
+        except (requests.exceptions.RequestException, KeyError,
+                ValueError) as e:
+            logging.debug('Could not get size of %s: %s', url, e)
+            return None
+
 
 @attr.s
 class ModuleV1(object):
@@ -484,6 +1179,7 @@ class ItemV2(object):
     type_name = attr.ib()
     lesson_id = attr.ib()
     module_id = attr.ib()
+    content_summary = attr.ib(default=None)
 
 
 @attr.s
@@ -499,7 +1195,8 @@ class ItemsV2(object):
                     item['slug'],
                     item['contentSummary']['typeName'],
                     item['lessonId'],
-                    item['moduleId']))
+                    item['moduleId'],
+                    item['contentSummary']))
             for item in data
         ))
 
@@ -507,11 +1204,30 @@ class ItemsV2(object):
         return self.children[key]
 
 
+def parse_resolution(resolution):
+    """
+    Return the height in pixels of a video resolution such as '720p' or
+    '1280x720' so that resolutions can be compared numerically.
+
+    @param resolution: Resolution as used by Coursera.
+    @type resolution: str
+
+    @return: Height of the resolution, 0 if it cannot be parsed.
+    @rtype: int
+    """
+    match = re.search(r'(\d+)\D*$', resolution or '')
+    return int(match.group(1)) if match else 0
+
+
 @attr.s
 class VideoV1(object):
     resolution = attr.ib()
     mp4_video_url = attr.ib()
 
+    @property
+    def height(self):
+        return parse_resolution(self.resolution)
+
 
 @attr.s
 class VideosV1(object):
@@ -523,7 +1239,7 @@ class VideosV1(object):
         videos = [VideoV1(resolution, links['mp4VideoUrl'])
                   for resolution, links
                   in data['sources']['byResolution'].items()]
-        videos.sort(key=lambda video: video.resolution, reverse=True)
+        videos.sort(key=lambda video: video.height, reverse=True)
 
         videos = OrderedDict(
             (video.resolution, video)
@@ -540,17 +1256,40 @@ class VideosV1(object):
     def get_best(self):
         return next(iter(self.children.values()))
 
+    def up_to(self, resolution=None):
+        """
+        Return videos not higher than the given resolution, lowest first.
+        The lowest video is returned if all of them are higher.
+
+        @param resolution: Highest acceptable resolution, no limit if None.
+        @type resolution: str
+
+        @rtype: [VideoV1]
+        """
+        videos = list(reversed(self.children.values()))
+        if resolution is None:
+            return videos
+
+        height = parse_resolution(resolution)
+        return [video for video in videos
+                if video.height <= height] or videos[:1]
+
 
-def expand_specializations(session, class_names):
+def expand_specializations(session, class_names, jobs=1):
     """
     Checks whether any given name is not a class but a specialization.
 
     If it's a specialization, expand the list of class names with the child
-    class names.
+    class names. Names are resolved with up to `jobs` concurrent requests,
+    the order of class names is preserved.
     """
+    create = budgeted(
+        session, lambda class_name: SpecializationV1.create(session,
+                                                            class_name))
+    specializations = map_ordered(create, class_names, jobs)
+
     result = []
-    for class_name in class_names:
-        specialization = SpecializationV1.create(session, class_name)
+    for class_name, specialization in zip(class_names, specializations):
         if specialization is None:
             result.append(class_name)
         else:
@@ -590,7 +1329,13 @@ class CourseraOnDemand(object):
 
     def __init__(self, session, course_id, course_name,
                  unrestricted_filenames=False,
-                 mathjax_cdn_url=None):
+                 mathjax_cdn_url=None,
+                 batch_lecture_assets=False,
+                 sidecar_assets_path=None,
+                 resolution_planner=None,
+                 local_transcripts=False,
+                 quiz_cache=None,
+                 quiz_jobs=None):
         """
         Initialize Coursera OnDemand API.
 
@@ -604,6 +1349,33 @@ class CourseraOnDemand(object):
             file names should endure stricter character filtering. @see
             `clean_filename` for the details.
         @type unrestricted_filenames: bool
+
+        @param batch_lecture_assets: Flag that indicates whether lecture
+            assets should be collected and resolved later in bulk by
+            `resolve_lecture_assets` instead of one by one.
+        @type batch_lecture_assets: bool
+
+        @param sidecar_assets_path: Directory for asset files of rendered
+            instructions, @see SidecarAssetStore. Assets are inlined into
+            the HTML if it is not given.
+        @type sidecar_assets_path: str
+
+        @param resolution_planner: Planner that chooses video resolutions
+            of lectures later, by `plan_video_resolutions`. The requested
+            resolution is used right away if it is not given.
+        @type resolution_planner: ResolutionPlanner
+
+        @param local_transcripts: Flag that indicates whether transcripts
+            (txt) should be derived from subtitles (srt) by the downloader
+            instead of being downloaded, @see TRANSCRIPT_MARKER.
+        @type local_transcripts: bool
+
+        @param quiz_cache: Store of rendered quizzes and exams.
+        @type quiz_cache: cache.RenderedQuizCache
+
+        @param quiz_jobs: Maximum number of quiz and exam sessions that
+            are open at the same time, no limit if None.
+        @type quiz_jobs: int
         """
         self._session = session
         self._notebook_cookies = None
@@ -614,9 +1386,23 @@ class CourseraOnDemand(object):
         self._user_id = None
 
         self._quiz_to_markup = QuizExamToMarkupConverter(session)
+        sidecar_store = SidecarAssetStore(session, sidecar_assets_path) \
+            if sidecar_assets_path else None
         self._markup_to_html = MarkupToHTMLConverter(
-            session, mathjax_cdn_url=mathjax_cdn_url)
+            session, mathjax_cdn_url=mathjax_cdn_url,
+            sidecar_store=sidecar_store)
         self._asset_retriever = AssetRetriever(session)
+        self._asset_batch = LectureAssetBatch() if batch_lecture_assets \
+            else None
+        self._resolution_planner = resolution_planner
+        self._local_transcripts = local_transcripts
+        self._reference_assets = {}
+        self._unresolved_asset_links = {}
+        self.polled_references = 0
+        self.requested_references = 0
+        self._quiz_cache = quiz_cache
+        self._quiz_slots = ConcurrencyBudget(quiz_jobs) if quiz_jobs \
+            else contextlib.nullcontext()
 
     def obtain_user_id(self):
         reply = get_page(self._session, OPENCOURSE_MEMBERSHIPS, json=True)
@@ -636,11 +1422,17 @@ class CourseraOnDemand(object):
         slugs = [element['slug'] for element in course_list]
         return slugs
 
-    def extract_links_from_exam(self, exam_id):
-        try:
+    def extract_links_from_exam(self, exam_id, item=None):
+        """
+        Return the rendered exam, @see extract_links_from_quiz.
+        """
+        def get_exam_json():
             session_id = self._get_exam_session_id(exam_id)
-            exam_json = self._get_exam_json(exam_id, session_id)
-            return self._convert_quiz_json_to_links(exam_json, 'exam')
+            return self._get_exam_json(exam_id, session_id)
+
+        try:
+            return self._extract_links_from_assessment(
+                item, get_exam_json, 'exam')
         except requests.exceptions.HTTPError as exception:
             logging.error('Could not download exam %s: %s', exam_id, exception)
             if is_debug_run():
@@ -648,92 +1440,6 @@ class CourseraOnDemand(object):
                     'Could not download exam %s: %s', exam_id, exception)
             return None
 
-    def _get_notebook_folder(self, url, jupyterId, **kwargs):
-
-        supplement_links = {}
-
-        url = url.format(**kwargs)
-        reply = get_page(self._session, url, json=True)
-
-        for content in reply['content']:
-
-            if content['type'] == 'directory':
-                a = self._get_notebook_folder(
-                    OPENCOURSE_NOTEBOOK_TREE, jupyterId, jupId=jupyterId,
-                    path=content['path'], timestamp=int(time.time()))
-                supplement_links.update(a)
-
-            elif content['type'] == 'file':
-                tmp_url = OPENCOURSE_NOTEBOOK_DOWNLOAD.format(
-                    path=content['path'], jupId=jupyterId,
-                    timestamp=int(time.time()))
-                filename, extension = os.path.splitext(clean_url(tmp_url))
-
-                head, tail = os.path.split(content['path'])
-                # '/' in the following line is for a reason:
-                # @noureddin says: "I split head using split('/') not
-                # os.path.split() because it's seems to me that it comes from a
-                # web page, so the separator will always be /, so using the
-                # native path splitting function is not the most portable
-                # way to do it."
-                # Original pull request:
-                # https://github.com/coursera-dl/coursera-dl/pull/654
-                head = '/'.join([clean_filename(dir, minimal_change=True)
-                                 for dir in head.split('/')])
-                tail = clean_filename(tail, minimal_change=True)
-
-                if not os.path.isdir(self._course_name + "/notebook/" + head + "/"):
-                    logging.info('Creating [%s] directories...', head)
-                    os.makedirs(self._course_name + "/notebook/" + head + "/")
-
-                r = requests.get(tmp_url.replace(" ", "%20"),
-                                 cookies=self._session.cookies)
-                if not os.path.exists(self._course_name + "/notebook/" + head + "/" + tail):
-                    logging.info('Downloading %s into %s', tail, head)
-                    with open(self._course_name + "/notebook/" + head + "/" + tail, 'wb+') as f:
-                        f.write(r.content)
-                else:
-                    logging.info('Skipping %s... (file exists)', tail)
-
-                if str(extension[1:]) not in supplement_links:
-                    supplement_links[str(extension[1:])] = []
-
-                supplement_links[str(extension[1:])].append(
-                    (tmp_url.replace(" ", "%20"), filename))
-
-            elif content['type'] == 'notebook':
-                tmp_url = OPENCOURSE_NOTEBOOK_DOWNLOAD.format(
-                    path=content['path'], jupId=jupyterId, timestamp=int(time.time()))
-                filename, extension = os.path.splitext(clean_url(tmp_url))
-
-                head, tail = os.path.split(content['path'])
-
-                if not os.path.isdir(self._course_name + "/notebook/" + head + "/"):
-                    logging.info('Creating [%s] directories...', head)
-                    os.makedirs(self._course_name + "/notebook/" + head + "/")
-
-                r = requests.get(tmp_url.replace(" ", "%20"),
-                                 cookies=self._session.cookies)
-                if not os.path.exists(self._course_name + "/notebook/" + head + "/" + tail):
-                    logging.info(
-                        'Downloading Jupyter %s into %s', tail, head)
-                    with open(self._course_name + "/notebook/" + head + "/" + tail, 'wb+') as f:
-                        f.write(r.content)
-                else:
-                    logging.info('Skipping %s... (file exists)', tail)
-
-                if "ipynb" not in supplement_links:
-                    supplement_links["ipynb"] = []
-
-                supplement_links["ipynb"].append(
-                    (tmp_url.replace(" ", "%20"), filename))
-
-            else:
-                logging.info(
-                    'Unsupported typename %s in notebook', content['type'])
-
-        return supplement_links
-
     def _get_notebook_json(self, notebook_id, authorizationId):
 
         headers = self._auth_headers_with_json()
@@ -752,14 +1458,8 @@ class CourseraOnDemand(object):
 
         jupyted_id = jupyted_id[0]
 
-        newReq = requests.Session()
-        req = newReq.get(OPENCOURSE_NOTEBOOK_TREE.format(
-            jupId=jupyted_id, path="/", timestamp=int(time.time())),
-            headers=headers)
-
-        return self._get_notebook_folder(
-            OPENCOURSE_NOTEBOOK_TREE, jupyted_id, jupId=jupyted_id,
-            path="/", timestamp=int(time.time()))
+        return NotebookSync(self._session, jupyted_id,
+                            self._course_name + '/notebook').sync()
 
     def extract_links_from_notebook(self, notebook_id):
 
@@ -775,11 +1475,27 @@ class CourseraOnDemand(object):
                     'Could not download notebook %s: %s', notebook_id, exception)
             return None
 
-    def extract_links_from_quiz(self, quiz_id):
-        try:
+    def extract_links_from_quiz(self, quiz_id, item=None):
+        """
+        Return the rendered quiz.
+
+        @param quiz_id: Quiz ID.
+        @type quiz_id: str
+
+        @param item: Syllabus item of the quiz. The rendered quiz is
+            looked up in and stored to the quiz cache by the item, if
+            both are given.
+        @type item: ItemV2
+
+        @return: @see CourseraOnDemand._extract_links_from_text
+        """
+        def get_quiz_json():
             session_id = self._get_quiz_session_id(quiz_id)
-            quiz_json = self._get_quiz_json(quiz_id, session_id)
-            return self._convert_quiz_json_to_links(quiz_json, 'quiz')
+            return self._get_quiz_json(quiz_id, session_id)
+
+        try:
+            return self._extract_links_from_assessment(
+                item, get_quiz_json, 'quiz')
         except requests.exceptions.HTTPError as exception:
             logging.error('Could not download quiz %s: %s', quiz_id, exception)
             if is_debug_run():
@@ -787,9 +1503,27 @@ class CourseraOnDemand(object):
                     'Could not download quiz %s: %s', quiz_id, exception)
             return None
 
-    def _convert_quiz_json_to_links(self, quiz_json, filename_suffix):
-        markup = self._quiz_to_markup(quiz_json)
-        html = self._markup_to_html(markup)
+    def _extract_links_from_assessment(self, item, get_json,
+                                       filename_suffix):
+        """
+        Render a quiz or exam unless its rendered page can be reused from
+        the quiz cache. Assessment sessions of cache misses are limited by
+        `quiz_jobs`.
+
+        @param get_json: Function that opens an assessment session and
+            returns the quiz/exam JSON.
+        @type get_json: callable() -> dict
+        """
+        use_cache = self._quiz_cache is not None and item is not None
+        html = self._quiz_cache.get(item) if use_cache else None
+
+        if html is None:
+            with self._quiz_slots:
+                assessment_json = get_json()
+            document = self._quiz_to_markup.to_document(assessment_json)
+            html = self._markup_to_html(document)
+            if use_cache:
+                self._quiz_cache.put(item, html)
 
         supplement_links = {}
         instructions = (IN_MEMORY_MARKER + html, filename_suffix)
@@ -880,10 +1614,11 @@ class CourseraOnDemand(object):
             links = self._extract_videos_and_subtitles_from_lecture(
                 course_id, video_id, subtitle_language, resolution)
 
-            assets = self._get_lecture_asset_ids(course_id, video_id)
-            assets = self._normalize_assets(assets)
-            extend_supplement_links(
-                links, self._extract_links_from_lecture_assets(assets))
+            entries = self._get_lecture_asset_entries(course_id, video_id)
+            if self._asset_batch is not None:
+                self._asset_batch.add(links, entries)
+            else:
+                self._add_asset_entries(entries, links)
 
             return links
         except requests.exceptions.HTTPError as exception:
@@ -894,16 +1629,83 @@ class CourseraOnDemand(object):
                     'Could not download lecture %s: %s', video_id, exception)
             return None
 
-    def _get_lecture_asset_ids(self, course_id, video_id):
+    def plan_video_resolutions(self):
+        """
+        Choose video resolutions of lectures extracted so far, @see
+        resolution_planner.
+        """
+        if self._resolution_planner is not None:
+            self._resolution_planner.plan()
+
+    def resolve_lecture_assets(self):
+        """
+        Resolve lecture assets collected so far (@see batch_lecture_assets)
+        with bulk requests and add them to their lecture links.
+
+        @return: True if all assets were resolved, False if an error
+            occurred.
+        @rtype: bool
+        """
+        if self._asset_batch is None:
+            return True
+
+        pending = self._asset_batch.take()
+        try:
+            self._resolve_asset_ids(
+                [entry['asset_id']
+                 for _links, entries in pending
+                 for entry in entries if 'asset_id' in entry])
+        except requests.exceptions.HTTPError as exception:
+            logging.error('Could not resolve lecture assets: %s', exception)
+            if is_debug_run():
+                logging.exception(
+                    'Could not resolve lecture assets: %s', exception)
+            # Pending entries may belong to lectures of later modules,
+            # @see has_unresolved_assets
+            for links, _entries in pending:
+                self._unresolved_asset_links[id(links)] = links
+            return False
+
+        for links, entries in pending:
+            self._add_asset_entries(entries, links)
+
+        return True
+
+    def has_unresolved_assets(self, links):
         """
-        Obtain a list of asset ids from a lecture.
+        Check whether lecture links lack their assets because the bulk
+        request that should have resolved them failed.
+
+        @param links: Lecture links.
+        @type links: @see CourseraOnDemand._extract_links_from_text
+
+        @rtype: bool
+        """
+        return id(links) in self._unresolved_asset_links
+
+    def _get_lecture_asset_entries(self, course_id, video_id):
+        """
+        Obtain a list of unresolved asset entries from a lecture.
+
+        The lecture assets reply already includes typeName and definition
+        of each open course asset, so no extra request per asset is needed
+        unless that information is missing.
+
+        @return: @see CourseraOnDemand._get_asset_entries
+        @rtype: [dict]
         """
         dom = get_page(self._session, OPENCOURSE_ONDEMAND_LECTURE_ASSETS_URL,
                        json=True, course_id=course_id, video_id=video_id)
-        # Note that we extract here "id", not definition -> assetId, as it
-        # be extracted later.
-        return [asset['id']
-                for asset in dom['linked']['openCourseAssets.v1']]
+
+        entries = []
+        for element in dom['linked']['openCourseAssets.v1']:
+            if 'typeName' in element and 'definition' in element:
+                entries.extend(self._parse_asset_element(element))
+            else:
+                asset_id = self._normalize_assets([element['id']])[0]
+                entries.extend(self._get_asset_entries(asset_id))
+
+        return entries
 
     def _normalize_assets(self, assets):
         """
@@ -931,101 +1733,127 @@ class CourseraOnDemand(object):
 
         return new_assets
 
-    def _extract_links_from_lecture_assets(self, asset_ids):
+    def _add_asset_entries(self, entries, links):
         """
-        Extract links to files of the asset ids.
+        Resolve asset entries (if not resolved yet) and add them to links.
 
-        @param asset_ids: List of asset ids.
-        @type asset_ids: [str]
+        @param entries: @see CourseraOnDemand._get_asset_entries
+        @type entries: [dict]
 
-        @return: @see CourseraOnDemand._extract_links_from_text
+        @param links: Links that will be extended in place.
+        @type links: @see CourseraOnDemand._extract_links_from_text
         """
-        links = {}
+        self._resolve_asset_ids([entry['asset_id'] for entry in entries
+                                 if 'asset_id' in entry])
+
+        for entry in entries:
+            if 'asset_id' in entry:
+                asset = self._asset_retriever.get(entry['asset_id'])
+                if asset is None:
+                    continue
+                self._add_asset_link(
+                    asset.name, asset.url, links,
+                    make_url_expiry('assets.v1', asset.id, asset.expires))
+            else:
+                self._add_asset_link(entry['name'], entry['url'], links)
 
-        def _add_asset(name, url, destination):
-            filename, extension = os.path.splitext(clean_url(name))
-            if extension=='':
-                return
+    def _resolve_asset_ids(self, asset_ids):
+        """
+        Download information about the assets that have not been
+        resolved yet (AssetRetriever skips cached ones).
+        """
+        if asset_ids:
+            self._asset_retriever(asset_ids, download=False)
 
-            extension = clean_filename(
-                extension.lower().strip('.').strip(),
-                self._unrestricted_filenames)
-            basename = clean_filename(
-                os.path.basename(filename),
-                self._unrestricted_filenames)
-            url = url.strip()
+    def _add_asset_link(self, name, url, destination, expiry=None):
+        filename, extension = os.path.splitext(clean_url(name))
+        if extension=='':
+            return
 
-            if extension not in destination:
-                destination[extension] = []
+        extension = clean_filename(
+            extension.lower().strip('.').strip(),
+            self._unrestricted_filenames)
+        basename = clean_filename(
+            os.path.basename(filename),
+            self._unrestricted_filenames)
+        url = url.strip()
+
+        if extension not in destination:
+            destination[extension] = []
+        if expiry is None:
             destination[extension].append((url, basename))
+        else:
+            destination[extension].append((url, basename, expiry))
 
-        for asset_id in asset_ids:
-            for asset in self._get_asset_urls(asset_id):
-                _add_asset(asset['name'], asset['url'], links)
-
-        return links
-
-    def _get_asset_urls(self, asset_id):
+    def _get_asset_entries(self, asset_id):
         """
-        Get list of asset urls and file names. This method may internally
-        use AssetRetriever to extract `asset` element types.
+        Get list of asset entries of an open course asset. Entries of `url`
+        elements are ready to use, entries of `asset` elements only carry
+        an id that is resolved by AssetRetriever later.
 
         @param asset_id: Asset ID.
         @type asset_id: str
 
-        @return List of dictionaries with asset file names and urls.
+        @return List of dictionaries with asset file names and urls or
+            with ids of assets that still need to be resolved.
         @rtype [{
             'name': '<filename.ext>'
             'url': '<url>'
+        } or {
+            'asset_id': '<id>'
         }]
         """
         dom = get_page(self._session, OPENCOURSE_ASSETS_URL,
                        json=True, id=asset_id)
         logging.debug('Parsing JSON for asset_id <%s>.', asset_id)
 
-        urls = []
-
+        entries = []
         for element in dom['elements']:
-            typeName = element['typeName']
-            definition = element['definition']
-
-            # Elements of `asset` types look as follows:
-            #
-            # {'elements': [{'definition': {'assetId': 'gtSfvscoEeW7RxKvROGwrw',
-            #                               'name': 'Презентация к лекции'},
-            #                'id': 'phxNlMcoEeWXCQ4nGuQJXw',
-            #                'typeName': 'asset'}],
-            #  'linked': None,
-            #  'paging': None}
-            #
-            if typeName == 'asset':
-                open_course_asset_id = definition['assetId']
-                for asset in self._asset_retriever([open_course_asset_id],
-                                                   download=False):
-                    urls.append({'name': asset.name, 'url': asset.url})
-
-            # Elements of `url` types look as follows:
-            #
-            # {'elements': [{'definition': {'name': 'What motivates you.pptx',
-            #                               'url': 'https://d396qusza40orc.cloudfront.net/learning/Powerpoints/2-4A_What_motivates_you.pptx'},
-            #                'id': '0hixqpWJEeWQkg5xdHApow',
-            #                'typeName': 'url'}],
-            #  'linked': None,
-            #  'paging': None}
-            #
-            elif typeName == 'url':
-                urls.append({'name': definition['name'].strip(),
-                             'url': definition['url'].strip()})
+            entries.extend(self._parse_asset_element(element, dom))
 
-            else:
-                logging.warning(
-                    'Unknown asset typeName: %s\ndom: %s\n'
-                    'If you think the downloader missed some '
-                    'files, please report the issue here:\n'
-                    'https://github.com/coursera-dl/coursera-dl/issues/new',
-                    typeName, json.dumps(dom, indent=4))
+        return entries
+
+    def _parse_asset_element(self, element, dom=None):
+        """
+        Turn an open course asset element into asset entries,
+        @see CourseraOnDemand._get_asset_entries
+        """
+        typeName = element['typeName']
+        definition = element['definition']
+
+        # Elements of `asset` types look as follows:
+        #
+        # {'elements': [{'definition': {'assetId': 'gtSfvscoEeW7RxKvROGwrw',
+        #                               'name': 'Презентация к лекции'},
+        #                'id': 'phxNlMcoEeWXCQ4nGuQJXw',
+        #                'typeName': 'asset'}],
+        #  'linked': None,
+        #  'paging': None}
+        #
+        if typeName == 'asset':
+            return [{'asset_id': definition['assetId']}]
+
+        # Elements of `url` types look as follows:
+        #
+        # {'elements': [{'definition': {'name': 'What motivates you.pptx',
+        #                               'url': 'https://d396qusza40orc.cloudfront.net/learning/Powerpoints/2-4A_What_motivates_you.pptx'},
+        #                'id': '0hixqpWJEeWQkg5xdHApow',
+        #                'typeName': 'url'}],
+        #  'linked': None,
+        #  'paging': None}
+        #
+        elif typeName == 'url':
+            return [{'name': definition['name'].strip(),
+                     'url': definition['url'].strip()}]
 
-        return urls
+        else:
+            logging.warning(
+                'Unknown asset typeName: %s\ndom: %s\n'
+                'If you think the downloader missed some '
+                'files, please report the issue here:\n'
+                'https://github.com/coursera-dl/coursera-dl/issues/new',
+                typeName, json.dumps(dom or element, indent=4))
+            return []
 
     def _extract_videos_and_subtitles_from_lecture(self,
                                                    course_id,
@@ -1035,8 +1863,10 @@ class CourseraOnDemand(object):
 
         logging.debug('Parsing JSON for video_id <%s>.', video_id)
 
+        # The reply carries signed video URLs, it is not cached
         dom = get_page(self._session, OPENCOURSE_ONDEMAND_LECTURE_VIDEOS_URL,
                        json=True,
+                       cache=False,
                        course_id=course_id,
                        video_id=video_id)
         dom = dom['linked']['onDemandVideos.v1'][0]
@@ -1066,6 +1896,11 @@ class CourseraOnDemand(object):
         lecture_video_content = {}
         for key, value in video_content.items():
             lecture_video_content[key] = [(value, '')]
+        lecture_video_content['mp4'] = [make_video_link(
+            source.mp4_video_url, course_id, video_id, source.resolution)]
+
+        if self._resolution_planner is not None:
+            self._resolution_planner.add(lecture_video_content, videos)
 
         return lecture_video_content
 
@@ -1122,6 +1957,13 @@ class CourseraOnDemand(object):
                 subtitle_set_download = set(['en'])
 
             for current_subtitle_language in subtitle_set_download:
+                srt_key = '%s.srt' % current_subtitle_language
+                if subtitle_node == 'subtitlesTxt' and \
+                        self._local_transcripts and srt_key in subtitle_links:
+                    subtitle_links['%s.txt' % current_subtitle_language] = \
+                        TRANSCRIPT_MARKER + subtitle_links[srt_key]
+                    continue
+
                 subtitle_url = subtitles.get(current_subtitle_language)
                 if subtitle_url is not None:
                     # some subtitle urls are relative!
@@ -1152,8 +1994,9 @@ class CourseraOnDemand(object):
             if not text:
                 return {}
 
-            supplement_links = self._extract_links_from_text(text)
-            instructions = (IN_MEMORY_MARKER + self._markup_to_html(text),
+            document = CMLDocument(text)
+            supplement_links = self._extract_links_from_text(document)
+            instructions = (IN_MEMORY_MARKER + self._markup_to_html(document),
                             'instructions')
             extend_supplement_links(
                 supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
@@ -1186,8 +2029,9 @@ class CourseraOnDemand(object):
             if not text:
                 return {}
 
-            supplement_links = self._extract_links_from_text(text)
-            instructions = (IN_MEMORY_MARKER + self._markup_to_html(text),
+            document = CMLDocument(text)
+            supplement_links = self._extract_links_from_text(document)
+            instructions = (IN_MEMORY_MARKER + self._markup_to_html(document),
                             'instructions')
             extend_supplement_links(
                 supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
@@ -1220,8 +2064,9 @@ class CourseraOnDemand(object):
             if not text:
                 return {}
 
-            supplement_links = self._extract_links_from_text(text)
-            instructions = (IN_MEMORY_MARKER + self._markup_to_html(text),
+            document = CMLDocument(text)
+            supplement_links = self._extract_links_from_text(document)
+            instructions = (IN_MEMORY_MARKER + self._markup_to_html(document),
                             'peer_assignment_instructions')
             extend_supplement_links(
                 supplement_links, {IN_MEMORY_EXTENSION: [instructions]})
@@ -1259,14 +2104,14 @@ class CourseraOnDemand(object):
             #           'value'
 
             for asset in dom['linked']['openCourseAssets.v1']:
-                value = asset['definition']['value']
+                document = CMLDocument(asset['definition']['value'])
                 # Supplement lecture types are known to contain both <asset> tags
                 # and <a href> tags (depending on the course), so we extract
                 # both of them.
                 extend_supplement_links(
-                    supplement_content, self._extract_links_from_text(value))
+                    supplement_content, self._extract_links_from_text(document))
 
-                instructions = (IN_MEMORY_MARKER + self._markup_to_html(value),
+                instructions = (IN_MEMORY_MARKER + self._markup_to_html(document),
                                 'instructions')
                 extend_supplement_links(
                     supplement_content, {IN_MEMORY_EXTENSION: [instructions]})
@@ -1286,7 +2131,7 @@ class CourseraOnDemand(object):
 
         @param text: Text to extract asset tags from. This text contains HTML
             code that is parsed by BeautifulSoup.
-        @type text: str
+        @type text: str or CMLDocument
 
         @return: Asset map.
         @rtype: {
@@ -1297,10 +2142,9 @@ class CourseraOnDemand(object):
             ...
         }
         """
-        soup = BeautifulSoup(text)
         asset_tags_map = {}
 
-        for asset in soup.find_all('asset'):
+        for asset in CMLDocument.of(text).soup.find_all('asset'):
             asset_tags_map[asset['id']] = {'name': asset['name'],
                                            'extension': asset['extension']}
 
@@ -1313,19 +2157,9 @@ class CourseraOnDemand(object):
         @param asset_ids: List of ids to get URLs for.
         @type assertn: [str]
 
-        @return: List of dictionaries with asset URLs and ids.
-        @rtype: [{
-            'id': '<id>',
-            'url': '<url>'
-        }]
+        @return: @see get_asset_urls
         """
-        dom = get_page(self._session, OPENCOURSE_ASSET_URL,
-                       json=True,
-                       ids=quote_plus(','.join(asset_ids)))
-
-        return [{'id': element['id'],
-                 'url': element['url'].strip()}
-                for element in dom['elements']]
+        return get_asset_urls(self._session, asset_ids)
 
     def extract_references_poll(self):
         try:
@@ -1335,6 +2169,13 @@ class CourseraOnDemand(object):
                            json=True
                            )
             logging.info('Downloaded resource poll (%d bytes)', len(dom))
+
+            # Reference contents are linked to the poll, they are used by
+            # extract_links_from_reference
+            self._reference_assets = dict(
+                (asset['id'], asset)
+                for asset in dom.get('linked', {}).get(
+                    'openCourseAssets.v1', []))
             return dom['elements']
 
         except requests.exceptions.HTTPError as exception:
@@ -1345,43 +2186,43 @@ class CourseraOnDemand(object):
                                   exception)
             return None
 
-    def extract_links_from_reference(self, short_id):
+    def extract_links_from_reference(self, short_id, reference=None):
         """
         Return a dictionary with supplement files (pdf, csv, zip, ipynb, html
         and so on) extracted from supplement page.
 
+        @param short_id: Short id of the reference.
+        @type short_id: str
+
+        @param reference: Element of the references poll (@see
+            extract_references_poll). Links are built from the content
+            linked to the poll if it is given and its content is there,
+            otherwise the reference is requested on its own.
+        @type reference: dict
+
         @return: @see CourseraOnDemand._extract_links_from_text
         """
-        logging.debug('Gathering resource URLs for short_id <%s>.', short_id)
-
         try:
+            assets = self._get_polled_reference_assets(reference)
+            if assets is not None:
+                self.polled_references += 1
+                return self._extract_links_from_reference_assets(assets)
+
+            logging.debug('Gathering resource URLs for short_id <%s>.',
+                          short_id)
+            self.requested_references += 1
             dom = get_page(self._session, OPENCOURSE_REFERENCE_ITEM_URL,
                            json=True,
                            course_id=self._course_id,
                            short_id=short_id)
 
-            resource_content = {}
-
             # Supplement content has structure as follows:
             # 'linked' {
             #   'openCourseAssets.v1' [ {
             #       'definition' {
             #           'value'
-
-            for asset in dom['linked']['openCourseAssets.v1']:
-                value = asset['definition']['value']
-                # Supplement lecture types are known to contain both <asset> tags
-                # and <a href> tags (depending on the course), so we extract
-                # both of them.
-                extend_supplement_links(
-                    resource_content, self._extract_links_from_text(value))
-
-                instructions = (IN_MEMORY_MARKER + self._markup_to_html(value),
-                                'resources')
-                extend_supplement_links(
-                    resource_content, {IN_MEMORY_EXTENSION: [instructions]})
-
-            return resource_content
+            return self._extract_links_from_reference_assets(
+                dom['linked']['openCourseAssets.v1'])
         except requests.exceptions.HTTPError as exception:
             logging.error('Could not download supplement %s: %s',
                           short_id, exception)
@@ -1390,6 +2231,54 @@ class CourseraOnDemand(object):
                                   short_id, exception)
             return None
 
+    def _get_polled_reference_assets(self, reference):
+        """
+        Return the content assets of a reference from the references poll.
+
+        @return: Assets or None if the poll does not have them.
+        @rtype: [dict]
+        """
+        if reference is None:
+            return None
+
+        # Expected poll structure:
+        # 'elements' [ {
+        #     'content' {
+        #         'definition' {
+        #             'assetId'
+        # 'linked' {
+        #   'openCourseAssets.v1' [ {
+        #       'id'
+        #       'definition' {
+        #           'value'
+        definition = (reference.get('content') or {}).get('definition') or {}
+        asset_id = definition.get('assetId')
+        asset = self._reference_assets.get(asset_id)
+        if asset is None or 'value' not in asset.get('definition', {}):
+            logging.info('Content of reference <%s> (asset %s) is not in '
+                         'the references poll, requesting it',
+                         reference.get('shortId'), asset_id)
+            return None
+        return [asset]
+
+    def _extract_links_from_reference_assets(self, assets):
+        resource_content = {}
+
+        for asset in assets:
+            document = CMLDocument(asset['definition']['value'])
+            # Supplement lecture types are known to contain both <asset> tags
+            # and <a href> tags (depending on the course), so we extract
+            # both of them.
+            extend_supplement_links(
+                resource_content, self._extract_links_from_text(document))
+
+            instructions = (IN_MEMORY_MARKER + self._markup_to_html(document),
+                            'resources')
+            extend_supplement_links(
+                resource_content, {IN_MEMORY_EXTENSION: [instructions]})
+
+        return resource_content
+
     def _extract_programming_immediate_instructions_text(self, element_id):
         """
         Extract assignment text (instructions).
@@ -1498,8 +2387,8 @@ class CourseraOnDemand(object):
             2. <asset> tags with id attribute (requires additional request
                to get the direct URL to the asset file)
 
-        @param text: HTML text.
-        @type text: str
+        @param text: HTML text, it is parsed once for both kinds of links.
+        @type text: str or CMLDocument
 
         @return: Dictionary with supplement links grouped by extension.
         @rtype: {
@@ -1513,12 +2402,16 @@ class CourseraOnDemand(object):
             ],
             ...
         }
+
+        Links to signed URLs carry their expiry record as the third
+        element, @see make_url_expiry.
         """
-        supplement_links = self._extract_links_from_a_tags_in_text(text)
+        document = CMLDocument.of(text)
+        supplement_links = self._extract_links_from_a_tags_in_text(document)
 
         extend_supplement_links(
             supplement_links,
-            self._extract_links_from_asset_tags_in_text(text))
+            self._extract_links_from_asset_tags_in_text(document))
 
         return supplement_links
 
@@ -1528,7 +2421,7 @@ class CourseraOnDemand(object):
         files.
 
         @param text: Page text.
-        @type text: str
+        @type text: str or CMLDocument
 
         @return: @see CourseraOnDemand._extract_links_from_text
         """
@@ -1553,9 +2446,14 @@ class CourseraOnDemand(object):
                 asset_tags_map[asset['id']]['extension'].strip(),
                 self._unrestricted_filenames)
             url = asset['url'].strip()
+            expiry = make_url_expiry('assetUrls.v1', asset['id'],
+                                     asset['expires'])
             if extension not in supplement_links:
                 supplement_links[extension] = []
-            supplement_links[extension].append((url, title))
+            if expiry is None:
+                supplement_links[extension].append((url, title))
+            else:
+                supplement_links[extension].append((url, title, expiry))
 
         return supplement_links
 
@@ -1565,7 +2463,7 @@ class CourseraOnDemand(object):
         with href attribute.
 
         @param text: HTML text.
-        @type text: str
+        @type text: str or CMLDocument
 
         @return: Dictionary with supplement links grouped by extension.
         @rtype: {
@@ -1579,7 +2477,7 @@ class CourseraOnDemand(object):
             ]
         }
         """
-        soup = BeautifulSoup(text)
+        soup = CMLDocument.of(text).soup
         links = [item['href'].strip()
                  for item in soup.find_all('a') if 'href' in item.attrs]
         links = sorted(list(set(links)))
@@ -0,0 +1,466 @@
+"""
+This module contains on-disk caches that live in PATH_CACHE and survive
+between runs.
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlparse
+
+from . import jsoncodec, syllabus
+from .define import (COURSERA_URL, SYLLABUS_CACHE_VERSION,
+                     ITEMS_CACHE_VERSION)
+from .parallel import Counters
+from .utils import mkdir_p, clean_filename
+
+
+def _atomic_write(filename, data):
+    """
+    Write data to a file so that readers never see a partially written
+    file: data goes to a temporary file first which then replaces the
+    target.
+
+    @param filename: Target file name.
+    @type filename: str
+
+    @param data: Contents of the file.
+    @type data: bytes
+    """
+    tmp_filename = '%s.%d.%d.tmp' % (filename, os.getpid(),
+                                     threading.get_ident())
+    with open(tmp_filename, 'wb') as file_object:
+        file_object.write(data)
+    os.replace(tmp_filename, filename)
+
+
+class HTTPCache(Counters):
+    """
+    Persistent cache of idempotent Coursera API GET replies. Replies are
+    stored together with their ETag/Last-Modified validators. A reply
+    younger than `ttl` seconds is served without a request, an older one
+    is revalidated with a conditional request and reused on 304.
+
+    Replies depend on the account (memberships, progress, assessment
+    sessions), so entries are keyed by the identity of the session as well
+    and are never served to another account.
+    """
+
+    def __init__(self, path, ttl=0, identity=None):
+        """
+        @param path: Directory that holds cached replies.
+        @type path: str
+
+        @param ttl: Number of seconds a cached reply is used without
+            revalidation.
+        @type ttl: int
+
+        @param identity: Authenticated identity of the session, e.g. the
+            CAUTH cookie. Only its hash is used.
+        @type identity: str
+        """
+        self._path = path
+        self._ttl = ttl
+        self._identity = hashlib.sha1(
+            (identity or '').encode('utf-8')).hexdigest()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def accepts(self, url):
+        """
+        Check whether replies of the given URL may be cached. Only
+        Coursera API requests are cached.
+        """
+        return urlparse(url).netloc == urlparse(COURSERA_URL).netloc
+
+    def fetch(self, url, headers, send):
+        """
+        Return a reply for the GET request, from cache if possible.
+
+        @param url: Request URL.
+        @type url: str
+
+        @param headers: Additional request headers.
+        @type headers: dict
+
+        @param send: Function that performs the request with the given
+            extra (conditional) headers and returns a reply.
+        @type send: callable(dict) -> requests.Response
+
+        @return: Requests response.
+        @rtype: requests.Response
+        """
+        key = self._key(url, headers)
+        entry = self._load(key)
+
+        if entry is not None and time.time() - entry['stored_at'] < self._ttl:
+            self._count('hits')
+            return self._make_reply(entry)
+
+        reply = send(self._validators(entry))
+
+        if reply.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            entry['stored_at'] = time.time()
+            self._save_meta(key, entry)
+            return self._make_reply(entry)
+
+        self._count('misses')
+        self._store(key, url, reply)
+        return reply
+
+    def report(self):
+        logging.info('HTTP cache: %d fresh, %d revalidated, %d downloaded',
+                     self.hits, self.revalidated, self.misses)
+
+    def _key(self, url, headers):
+        identity = json.dumps([self._identity, url, sorted(headers.items())])
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _filename(self, key, extension):
+        return os.path.join(self._path, key[:2], key + extension)
+
+    def _validators(self, entry):
+        if entry is None:
+            return {}
+
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def _load(self, key):
+        try:
+            with open(self._filename(key, '.json'), 'rb') as file_object:
+                entry = jsoncodec.load(file_object)
+            with open(self._filename(key, '.body'), 'rb') as file_object:
+                entry['body'] = file_object.read()
+        except (IOError, OSError, ValueError):
+            return None
+        return entry
+
+    def _store(self, key, url, reply):
+        content_type = reply.headers.get('Content-Type', '')
+        etag = reply.headers.get('ETag')
+        last_modified = reply.headers.get('Last-Modified')
+
+        if reply.status_code != 200 or \
+                not content_type.startswith('application/json'):
+            return
+
+        # Without validators the reply can only be reused within ttl
+        if not (etag or last_modified or self._ttl > 0):
+            return
+
+        entry = {
+            'url': url,
+            'stored_at': time.time(),
+            'etag': etag,
+            'last_modified': last_modified,
+            'encoding': reply.encoding,
+            'headers': {'Content-Type': content_type}
+        }
+        try:
+            mkdir_p(os.path.dirname(self._filename(key, '.body')))
+            _atomic_write(self._filename(key, '.body'), reply.content)
+            self._save_meta(key, entry)
+        except (IOError, OSError) as e:
+            logging.debug('Could not cache reply of %s: %s', url, e)
+
+    def _save_meta(self, key, entry):
+        meta = dict((k, v) for k, v in entry.items() if k != 'body')
+        _atomic_write(self._filename(key, '.json'),
+                      jsoncodec.dumpb(meta))
+
+    def _make_reply(self, entry):
+        reply = requests.models.Response()
+        reply.status_code = 200
+        reply.reason = 'OK'
+        reply.url = entry['url']
+        reply.encoding = entry['encoding']
+        reply.headers = CaseInsensitiveDict(entry['headers'])
+        reply._content = entry['body']
+        return reply
+
+
+class ItemLinksCache(object):
+    """
+    Persistent per-course store of extracted syllabus item links used for
+    incremental re-sync. Every item is stored with a fingerprint of its
+    syllabus entry (id, typeName, lesson and module ids, contentSummary)
+    and of the extraction options; links are reused only while the
+    fingerprint stays the same.
+    """
+
+    def __init__(self, path, class_name, options):
+        """
+        @param path: Directory that holds per-course files.
+        @type path: str
+
+        @param class_name: Course name (slug).
+        @type class_name: str
+
+        @param options: Extraction options that affect extracted links,
+            e.g. subtitle language or video resolution.
+        @type options: dict
+        """
+        self._filename = os.path.join(
+            path, clean_filename(class_name) + '.json')
+        self._options = options
+        self._lock = threading.Lock()
+        self._stored = self._load()
+        self._items = {}
+
+        self.reused = 0
+        self.extracted = 0
+
+    def get(self, item):
+        """
+        Return stored links of an unchanged item.
+
+        @param item: Syllabus item.
+        @type item: ItemV2
+
+        @return: Links of the item or None if the item is new or changed.
+        @rtype: @see CourseraOnDemand._extract_links_from_text
+        """
+        stored = self._stored.get(item.id)
+        if stored is None or stored['fingerprint'] != self._fingerprint(item):
+            with self._lock:
+                self.extracted += 1
+            return None
+
+        with self._lock:
+            self.reused += 1
+        return stored['links']
+
+    def put(self, item, links):
+        """
+        Remember links of an item. Items that are not put during a run are
+        forgotten when the store is saved.
+        """
+        with self._lock:
+            self._items[item.id] = {'fingerprint': self._fingerprint(item),
+                                    'links': links}
+
+    def save(self):
+        try:
+            mkdir_p(os.path.dirname(self._filename))
+            _atomic_write(self._filename,
+                          jsoncodec.dumpb(self._items))
+        except (IOError, OSError) as e:
+            logging.warning('Could not save item cache %s: %s',
+                            self._filename, e)
+
+        logging.info('Incremental sync: %d items reused, %d extracted',
+                     self.reused, self.extracted)
+
+    def _fingerprint(self, item):
+        identity = json.dumps([ITEMS_CACHE_VERSION, item.id, item.type_name,
+                               item.lesson_id, item.module_id,
+                               item.content_summary, self._options],
+                              sort_keys=True)
+        return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self._filename, 'rb') as file_object:
+                return jsoncodec.load(file_object)
+        except (IOError, OSError, ValueError):
+            return {}
+
+
+class RenderedQuizCache(Counters):
+    """
+    Persistent store of rendered quiz and exam HTML. Every page is keyed
+    by a fingerprint of its syllabus item (id, typeName, contentSummary)
+    and of the rendering options, so a page is reused only while the
+    assessment stays the same. Pages are stored gzip-compressed, one file
+    per fingerprint.
+    """
+
+    def __init__(self, path, options):
+        """
+        @param path: Directory that holds rendered pages.
+        @type path: str
+
+        @param options: Options that affect rendered pages, e.g. MathJax
+            URL.
+        @type options: dict
+        """
+        self._path = path
+        self._options = options
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, item):
+        """
+        Return the stored page of an unchanged quiz or exam.
+
+        @param item: Syllabus item.
+        @type item: ItemV2
+
+        @return: Rendered HTML or None if nothing usable is stored.
+        @rtype: str
+        """
+        try:
+            with gzip.open(self._filename(item), 'rb') as file_object:
+                html = file_object.read().decode('utf-8')
+        except (IOError, OSError, EOFError, UnicodeDecodeError):
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return html
+
+    def put(self, item, html):
+        """
+        Store the rendered page of a quiz or exam.
+        """
+        filename = self._filename(item)
+        try:
+            mkdir_p(os.path.dirname(filename))
+            _atomic_write(filename, gzip.compress(html.encode('utf-8')))
+        except (IOError, OSError) as e:
+            logging.debug('Could not cache rendered %s: %s', item.id, e)
+
+    def report(self):
+        logging.info('Quiz cache: %d reused, %d rendered',
+                     self.hits, self.misses)
+
+    def _filename(self, item):
+        identity = json.dumps([item.id, item.type_name, item.content_summary,
+                               self._options], sort_keys=True)
+        key = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+        return os.path.join(self._path, key[:2], key + '.html.gz')
+
+
+class SyllabusCache(object):
+    """
+    Persistent store of parsed syllabi (the modules returned by the
+    extractor). Entries are keyed by class name and the extraction
+    options, stored as gzip-compressed JSON (@see syllabus.to_json)
+    together with a schema version and evicted least recently used first
+    once the store grows beyond `max_size` bytes.
+    """
+
+    def __init__(self, path, max_size):
+        """
+        @param path: Directory that holds stored syllabi.
+        @type path: str
+
+        @param max_size: Maximum total size of the store in bytes.
+        @type max_size: int
+        """
+        self._path = path
+        self._max_size = max_size
+
+    def load(self, class_name, options):
+        """
+        Return the stored syllabus.
+
+        @param class_name: Course name (slug).
+        @type class_name: str
+
+        @param options: Extraction options the syllabus was parsed with.
+        @type options: dict
+
+        @return: Parsed modules or None if nothing usable is stored.
+        @rtype: [syllabus.Module]
+        """
+        filename = self._filename(class_name, options)
+        try:
+            with gzip.open(filename, 'rb') as file_object:
+                entry = jsoncodec.load(file_object)
+        except (IOError, OSError, ValueError, EOFError):
+            return None
+
+        if entry.get('version') != SYLLABUS_CACHE_VERSION or \
+                entry.get('class_name') != class_name:
+            logging.debug('Ignoring stale syllabus cache %s', filename)
+            return None
+
+        try:
+            modules = syllabus.from_json(entry['modules'])
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            logging.debug('Ignoring broken syllabus cache %s: %s',
+                          filename, e)
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+
+        return modules
+
+    def save(self, class_name, options, modules):
+        """
+        Store a parsed syllabus and evict old entries if necessary.
+        """
+        filename = self._filename(class_name, options)
+        entry = {
+            'version': SYLLABUS_CACHE_VERSION,
+            'class_name': class_name,
+            'options': options,
+            'modules': syllabus.to_json(modules)
+        }
+        try:
+            mkdir_p(self._path)
+            _atomic_write(filename, gzip.compress(
+                jsoncodec.dumpb(entry)))
+        except (IOError, OSError) as e:
+            logging.warning('Could not save syllabus cache %s: %s',
+                            filename, e)
+            return
+
+        self._evict(keep=filename)
+
+    def _filename(self, class_name, options):
+        identity = json.dumps(options, sort_keys=True)
+        digest = hashlib.sha1(identity.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self._path, '%s-%s.json.gz' % (
+            clean_filename(class_name), digest))
+
+    def _evict(self, keep):
+        entries = []
+        for name in os.listdir(self._path):
+            filename = os.path.join(self._path, name)
+            if not name.endswith('.json.gz') or filename == keep:
+                continue
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+
+        total_size = sum(size for _mtime, size, _filename in entries)
+        try:
+            total_size += os.path.getsize(keep)
+        except OSError:
+            pass
+
+        for _mtime, size, filename in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            logging.debug('Evicting syllabus cache %s', filename)
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            total_size -= size
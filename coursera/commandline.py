@@ -12,6 +12,7 @@ __courseradlversion__ = '0.12.0b0'
 # from maingui import __version__
 
 from .credentials import get_credentials, CredentialsError
+from .utils import HTML_PARSERS
 
 LOCAL_CONF_FILE_NAME = 'coursera-dl.conf'
 
@@ -78,6 +79,39 @@ def parse_args(args=None):
         help='number of parallel jobs to use for '
         'downloading resources. (Default: 1)')
 
+    group_basic.add_argument(
+        '--extract-jobs',
+        dest='extract_jobs',
+        action='store',
+        default=4,
+        type=int,
+        help='number of parallel jobs to use for '
+        'extracting lecture links from the syllabus. (Default: 4)')
+
+    group_basic.add_argument(
+        '--concurrency-budget',
+        dest='concurrency_budget',
+        action='store',
+        default=8,
+        type=int,
+        help='maximum number of extraction and download jobs that run at '
+        'the same time, shared by all courses. The syllabus of the next '
+        'course is extracted while the current one is being downloaded. '
+        '0 means no limit. (Default: 8)')
+
+    group_basic.add_argument(
+        '--max-jobs',
+        dest='max_jobs',
+        action='store',
+        default=0,
+        type=int,
+        help='adapt the number of parallel requests to the API and to the '
+        'video servers, starting from --extract-jobs and --jobs and '
+        'staying within this maximum: the number grows while replies are '
+        'fast and is cut on rate limit replies, server errors and '
+        'timeouts. Jobs are still limited by --concurrency-budget. '
+        '0 disables adaptation. (Default: 0)')
+
     group_basic.add_argument(
         '--download-delay',
         dest='download_delay',
@@ -158,6 +192,16 @@ def parse_args(args=None):
         default=False,
         help='download Python Jupyther Notebooks. (Default: False)')
 
+    group_material.add_argument(
+        '--sidecar-assets',
+        dest='sidecar_assets',
+        action='store_true',
+        default=False,
+        help='save images and audio of instructions, supplements and '
+        'quizzes as files in the _assets directory of the course instead '
+        'of embedding them into the HTML pages. Ignored with '
+        '--skip-download and --only-syllabus. (Default: False)')
+
     group_material.add_argument(
         '--about',  # FIXME: should be --about-course
         dest='about',
@@ -219,6 +263,45 @@ def parse_args(args=None):
         'only valid for on-demand courses; '
         'only values allowed: 360p, 540p, 720p')
 
+    group_material.add_argument(
+        '--video-budget',
+        dest='video_budget',
+        action='store',
+        default=None,
+        type=int,
+        help='total size in megabytes of the videos of a course; the '
+        'resolution of every lecture is chosen so that the course fits, '
+        'with --video-resolution as the highest one considered '
+        '(default: disabled)')
+
+    group_material.add_argument(
+        '--video-download-time',
+        dest='video_download_time',
+        action='store',
+        default=None,
+        type=int,
+        help='target time in minutes for downloading the videos of a '
+        'course at --video-bandwidth, works like --video-budget '
+        '(default: disabled)')
+
+    group_material.add_argument(
+        '--video-bandwidth',
+        dest='video_bandwidth',
+        action='store',
+        default=10,
+        type=float,
+        help='expected download bandwidth in megabits per second, used by '
+        '--video-download-time (default: 10)')
+
+    group_material.add_argument(
+        '--local-transcripts',
+        dest='local_transcripts',
+        action='store_true',
+        default=False,
+        help='derive plain text transcripts (txt) from downloaded '
+        'subtitles (srt) instead of downloading them separately '
+        '(default: False)')
+
     group_material.add_argument(
         '--disable-url-skipping',
         dest='disable_url_skipping',
@@ -376,7 +459,7 @@ def parse_args(args=None):
         dest='clear_cache',
         action='store_true',
         default=False,
-        help='clear cached cookies')
+        help='clear cached cookies and API replies')
 
     # Advanced miscellaneous options
     group_adv_misc = parser.add_argument_group(
@@ -404,6 +487,79 @@ def parse_args(args=None):
         help='the cdn address of MathJax.js'
     )
 
+    group_adv_misc.add_argument(
+        '--incremental',
+        dest='incremental',
+        action='store_true',
+        default=False,
+        help='extract only syllabus items that are new or changed since '
+        'the previous run and reuse stored links for the rest '
+        '(Default: False)')
+
+    group_adv_misc.add_argument(
+        '--cache-quizzes',
+        dest='cache_quizzes',
+        action='store_true',
+        default=False,
+        help='store rendered quizzes and exams on disk and reuse them '
+        'while their syllabus items do not change, without opening '
+        'assessment sessions (Default: False)')
+
+    group_adv_misc.add_argument(
+        '--quiz-jobs',
+        dest='quiz_jobs',
+        action='store',
+        default=2,
+        type=int,
+        help='maximum number of quiz and exam sessions opened at the same '
+        'time, 0 means no limit (Default: 2)')
+
+    group_adv_misc.add_argument(
+        '--api-retries',
+        dest='api_retries',
+        action='store',
+        default=3,
+        type=int,
+        help='number of times an API request is retried after a connection '
+        'error, a server error or a rate limit reply, with growing delays; '
+        '0 disables retries (Default: 3)')
+
+    group_adv_misc.add_argument(
+        '--http-cache-ttl',
+        dest='http_cache_ttl',
+        action='store',
+        default=0,
+        type=int,
+        help='number of seconds cached API replies are reused without '
+        'asking the server; older replies are revalidated (Default: 0)')
+
+    group_adv_misc.add_argument(
+        '--no-http-cache',
+        dest='no_http_cache',
+        action='store_true',
+        default=False,
+        help='do not cache API replies on disk (Default: False)')
+
+    group_adv_misc.add_argument(
+        '--asset-cache-size',
+        dest='asset_cache_size',
+        action='store',
+        default=32,
+        type=int,
+        help='maximum size in megabytes of downloaded instruction assets '
+        '(images, audio) kept in memory for reuse, least recently used '
+        'ones are dropped first (Default: 32)')
+
+    group_adv_misc.add_argument(
+        '--html-parser',
+        dest='html_parser',
+        action='store',
+        choices=('auto',) + HTML_PARSERS,
+        default='auto',
+        help='parser used for course pages and instructions markup; auto '
+        'uses lxml, if installed, for large pages where it is faster and '
+        'html.parser for the others (Default: auto)')
+
     # Debug options
     group_debug = parser.add_argument_group('Debugging options')
 
@@ -426,7 +582,16 @@ def parse_args(args=None):
         dest='cache_syllabus',
         action='store_true',
         default=False,
-        help='cache course syllabus into a file')
+        help='cache parsed course syllabus and reuse it on the next run')
+
+    group_debug.add_argument(
+        '--syllabus-cache-size',
+        dest='syllabus_cache_size',
+        action='store',
+        default=64,
+        type=int,
+        help='maximum size in megabytes of all cached syllabi, least '
+        'recently used ones are removed first (Default: 64)')
 
     group_debug.add_argument(
         '--version',
@@ -20,6 +20,7 @@ except ImportError:
 from io import StringIO
 from http import cookiejar as cookielib
 from .define import CLASS_URL, AUTH_REDIRECT_URL, PATH_COOKIES, AUTH_URL_V3
+from .network import counting_pool_classes
 from .utils import mkdir_p, random_string
 
 # Monkey patch cookielib.Cookie.__init__.
@@ -378,8 +379,25 @@ class TLSAdapter(HTTPAdapter):
     connections.
     """
 
+    __attrs__ = HTTPAdapter.__attrs__ + ['_stats']
+
+    def __init__(self, stats=None, **kwargs):
+        """
+        @param stats: Connection counters to update, @see
+            network.ConnectionStats. Connections are not counted if None.
+        @type stats: network.ConnectionStats
+
+        Other keyword arguments (e.g. pool_maxsize) are passed to
+        HTTPAdapter.
+        """
+        self._stats = stats
+        super(TLSAdapter, self).__init__(**kwargs)
+
     def init_poolmanager(self, connections, maxsize, block=False):
         self.poolmanager = PoolManager(num_pools=connections,
                                        maxsize=maxsize,
                                        block=block,
                                        ssl_version=ssl.PROTOCOL_TLSv1_2)
+        if self._stats is not None:
+            self.poolmanager.pool_classes_by_scheme = \
+                counting_pool_classes(self._stats)
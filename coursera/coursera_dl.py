@@ -60,19 +60,27 @@ import requests
 from .cookies import (
     AuthenticationFailed, ClassNotFound,
     get_cookies_for_class, make_cookie_values, TLSAdapter, login)
-from .define import (CLASS_URL, ABOUT_URL, PATH_CACHE)
+from .define import (CLASS_URL, ABOUT_URL, PATH_CACHE, PATH_HTTP_CACHE,
+                     PATH_SYLLABUS_CACHE)
 from .downloaders import get_downloader
 from .workflow import CourseraDownloader
-from .parallel import ConsecutiveDownloader, ParallelDownloader
+from .parallel import (ConsecutiveDownloader, ParallelDownloader,
+                       ConcurrencyBudget, AdaptiveConcurrency,
+                       worker_pool)
 from .utils import (clean_filename, get_anchor_format, mkdir_p, fix_url,
                    print_ssl_error_message,
                    BeautifulSoup, is_debug_run,
-                   spit_json, slurp_json)
+                   spit_json, set_html_parser, get_html_parser,
+                   normalize_path)
 
-from .api import expand_specializations
-from .network import get_page, get_page_and_url
+from .api import expand_specializations, SignedURLRefresher, AssetCache
+from .network import (get_page, get_page_and_url, RequestCache,
+                      ConnectionStats, RetryPolicy)
+from .cache import HTTPCache, SyllabusCache
 from .commandline import parse_args
 from .extractors import CourseraExtractor
+from .transcripts import TranscriptWriter
+from .syllabus import to_json as syllabus_to_json
 
 
 # URL containing information about outdated modules
@@ -82,19 +90,43 @@ assert V(requests.__version__) >= V('2.4'), "Upgrade requests!" + _SEE_URL
 assert V(bs4.__version__) >= V('4.1'), "Upgrade bs4!" + _SEE_URL
 
 
-def get_session():
+def get_session(pool_size=requests.adapters.DEFAULT_POOLSIZE):
     """
     Create a session with TLS v1.2 certificate.
+
+    @param pool_size: Number of connections kept alive per host.
+    @type pool_size: int
     """
 
     session = requests.Session()
-    session.mount('https://', TLSAdapter())
+    session.connection_stats = ConnectionStats()
+    session.mount('https://', TLSAdapter(stats=session.connection_stats,
+                                         pool_maxsize=pool_size))
+    session.request_cache = RequestCache()
 
     return session
 
 
+def _get_pool_size(args):
+    """
+    Return the number of connections per host that the session should
+    keep alive: enough for the download jobs and the extraction jobs of
+    the current and the prefetched course, unless the concurrency budget
+    allows fewer work units at a time; never less than the requests
+    default, which leaves room for helpers that are not budgeted.
+    """
+    if args.max_jobs > 0:
+        # Requests to a host are limited by the adaptive controller
+        pool_size = args.max_jobs
+    else:
+        pool_size = args.jobs + 2 * args.extract_jobs
+    if args.concurrency_budget > 0:
+        pool_size = min(pool_size, args.concurrency_budget)
+    return max(pool_size, requests.adapters.DEFAULT_POOLSIZE)
+
+
 def create_session(args):
-    session = get_session()
+    session = get_session(_get_pool_size(args))
     if args.cookies_cauth:
         session.cookies.set('CAUTH', args.cookies_cauth)
     elif args.browser:
@@ -133,9 +165,32 @@ def create_session(args):
         session.cookies.set('CAUTH', cauth_cookie)
     else:
         login(session, args.username, args.password)
+
+    if not args.no_http_cache:
+        session.http_cache = HTTPCache(PATH_HTTP_CACHE,
+                                       ttl=args.http_cache_ttl,
+                                       identity=session.cookies.get('CAUTH'))
+    session.asset_cache = AssetCache(args.asset_cache_size * 1024 * 1024)
+    if args.concurrency_budget > 0:
+        session.concurrency_budget = ConcurrencyBudget(
+            args.concurrency_budget)
+    if args.api_retries > 0:
+        session.retry_policy = RetryPolicy(args.api_retries)
+    if args.max_jobs > 0:
+        AdaptiveConcurrency(args.extract_jobs, args.jobs,
+                            args.max_jobs).install(session)
     return session
 
 
+def _get_jobs(args, jobs):
+    """
+    Return the number of worker threads for jobs: with adaptive
+    concurrency the controller decides how many of up to --max-jobs
+    threads make requests, otherwise the given number of jobs.
+    """
+    return max(jobs, args.max_jobs)
+
+
 def list_courses(args):
     """
     List enrolled courses.
@@ -151,44 +206,165 @@ def list_courses(args):
         logging.info(course)
 
 
-def download_on_demand_class(session, args, class_name):
+def _get_video_budget(args):
+    """
+    Return the video size budget of a course in bytes given by
+    --video-budget and --video-download-time, the smaller one if both
+    are given.
+
+    @param args: Command-line arguments.
+    @type args: namedtuple
+
+    @return: Budget in bytes or None if videos are not budgeted.
+    @rtype: int
+    """
+    budgets = []
+    if args.video_budget is not None:
+        budgets.append(args.video_budget * 1024 * 1024)
+    if args.video_download_time is not None:
+        budgets.append(int(args.video_download_time * 60 *
+                           args.video_bandwidth * 1000 * 1000 / 8))
+    return min(budgets) if budgets else None
+
+
+class CourseSyllabus(object):
+    """
+    Parsed modules of a class. Modules come either from the syllabus cache
+    or from a stream that extracts them while they are being consumed;
+    the extracted syllabus can be stored (@see store) once it has been
+    consumed completely.
+    """
+
+    def __init__(self, session, args, class_name):
+        self.class_name = class_name
+        self._args = args
+
+        self._syllabus_cache = SyllabusCache(
+            PATH_SYLLABUS_CACHE, args.syllabus_cache_size * 1024 * 1024)
+        # Runs that download nothing do not write sidecar files either;
+        # the option is part of the cache keys, so pages rendered without
+        # sidecar files are never reused by a run that writes them
+        sidecar_assets_path = None
+        if args.sidecar_assets and not (args.skip_download or
+                                        args.only_syllabus):
+            sidecar_assets_path = normalize_path(
+                os.path.join(args.path, class_name, '_assets'))
+        self._options = {
+            'reverse': args.reverse,
+            'unrestricted_filenames': args.unrestricted_filenames,
+            'subtitle_language': args.subtitle_language,
+            'video_resolution': args.video_resolution,
+            'download_quizzes': args.download_quizzes,
+            'download_notebooks': args.download_notebooks,
+            'mathjax_cdn_url': args.mathjax_cdn_url,
+            'sidecar_assets_path': sidecar_assets_path,
+            'video_budget': _get_video_budget(args),
+            'local_transcripts': args.local_transcripts,
+            'html_parser': get_html_parser()
+        }
+
+        self._stream = None
+        self._modules = None
+        if args.cache_syllabus:
+            self._modules = self._syllabus_cache.load(class_name,
+                                                      self._options)
+            if self._modules is not None:
+                logging.info('Using cached syllabus of %s', class_name)
+
+        if self._modules is None:
+            # Modules are downloaded while the rest of the syllabus is
+            # still being extracted
+            extractor = CourseraExtractor(session)
+            self._stream = extractor.stream_modules(
+                class_name,
+                args.reverse,
+                args.unrestricted_filenames,
+                args.subtitle_language,
+                args.video_resolution,
+                args.download_quizzes,
+                args.mathjax_cdn_url,
+                args.download_notebooks,
+                _get_jobs(args, args.extract_jobs),
+                args.incremental,
+                sidecar_assets_path,
+                self._options['video_budget'],
+                args.local_transcripts,
+                args.cache_quizzes,
+                args.quiz_jobs
+            )
+            self._modules = self._stream
+
+        self._save = self._stream is not None and (
+            is_debug_run() or args.cache_syllabus)
+        self._parsed_modules = []
+        if self._save:
+            self._modules = _record_modules(self._modules,
+                                            self._parsed_modules)
+
+    def __iter__(self):
+        return iter(self._modules)
+
+    @property
+    def error_occurred(self):
+        """
+        Whether errors occurred while parsing the syllabus. Only known
+        after all modules have been consumed.
+        """
+        return self._stream is not None and self._stream.error_occurred
+
+    def prefetch(self):
+        """
+        Extract the whole syllabus right away (used to extract the next
+        class while the current one is being downloaded).
+
+        @return: self
+        @rtype: CourseSyllabus
+        """
+        self._modules = list(self._modules)
+        return self
+
+    def store(self):
+        if not self._save:
+            return
+        if is_debug_run():
+            spit_json(syllabus_to_json(self._parsed_modules),
+                      '%s-syllabus-parsed.json' % self.class_name)
+        # A syllabus with errors would hide the missing items on reuse
+        if self._args.cache_syllabus and not self.error_occurred:
+            self._syllabus_cache.save(self.class_name, self._options,
+                                      self._parsed_modules)
+
+
+def download_on_demand_class(session, args, class_name, syllabus=None):
     """
     Download all requested resources from the on-demand class given
     in class_name.
 
+    @param syllabus: Syllabus of the class if it has been prefetched.
+    @type syllabus: CourseSyllabus
+
     @return: Tuple of (bool, bool), where the first bool indicates whether
         errors occurred while parsing syllabus, the second bool indicates
         whether the course appears to be completed.
     @rtype: (bool, bool)
     """
-
-    error_occurred = False
-    extractor = CourseraExtractor(session)
-
-    cached_syllabus_filename = '%s-syllabus-parsed.json' % class_name
-    if args.cache_syllabus and os.path.isfile(cached_syllabus_filename):
-        modules = slurp_json(cached_syllabus_filename)
-    else:
-        error_occurred, modules = extractor.get_modules(
-            class_name,
-            args.reverse,
-            args.unrestricted_filenames,
-            args.subtitle_language,
-            args.video_resolution,
-            args.download_quizzes,
-            args.mathjax_cdn_url,
-            args.download_notebooks
-        )
-
-    if is_debug_run or args.cache_syllabus():
-        spit_json(modules, cached_syllabus_filename)
+    if syllabus is None:
+        syllabus = CourseSyllabus(session, args, class_name)
 
     if args.only_syllabus:
-        return error_occurred, False
+        # Nothing to download, just walk through the syllabus
+        for _module in syllabus:
+            pass
+        syllabus.store()
+        return syllabus.error_occurred, False
 
+    budget = getattr(session, 'concurrency_budget', None)
     downloader = get_downloader(session, class_name, args)
-    downloader_wrapper = ParallelDownloader(downloader, args.jobs) \
-        if args.jobs > 1 else ConsecutiveDownloader(downloader)
+    controller = getattr(session, 'adaptive_concurrency', None)
+    jobs = _get_jobs(args, args.jobs)
+    downloader_wrapper = ParallelDownloader(downloader, jobs, budget,
+                                            controller) \
+        if jobs > 1 else ConsecutiveDownloader(downloader, budget)
 
     # obtain the resources
 
@@ -196,16 +372,25 @@ def download_on_demand_class(session, args, class_name):
     if args.ignore_formats:
         ignored_formats = args.ignore_formats.split(",")
 
+    transcript_writer = None
+    if args.local_transcripts:
+        transcript_writer = TranscriptWriter(session)
+
     course_downloader = CourseraDownloader(
         downloader_wrapper,
         commandline_args=args,
         class_name=class_name,
         path=args.path,
         ignored_formats=ignored_formats,
-        disable_url_skipping=args.disable_url_skipping
+        disable_url_skipping=args.disable_url_skipping,
+        url_refresher=SignedURLRefresher(session),
+        transcript_writer=transcript_writer
     )
 
-    completed = course_downloader.download_modules(modules)
+    completed = course_downloader.download_modules(syllabus)
+
+    error_occurred = syllabus.error_occurred
+    syllabus.store()
 
     # Print skipped URLs if any
     if course_downloader.skipped_urls:
@@ -219,6 +404,15 @@ def download_on_demand_class(session, args, class_name):
     return error_occurred, completed
 
 
+def _record_modules(modules, parsed_modules):
+    """
+    Pass modules through, remembering each of them in parsed_modules.
+    """
+    for module in modules:
+        parsed_modules.append(module)
+        yield module
+
+
 def print_skipped_urls(skipped_urls):
     logging.info('The following URLs (%d) have been skipped and not '
                  'downloaded:', len(skipped_urls))
@@ -239,17 +433,40 @@ def print_failed_urls(failed_urls):
     logging.info('-' * 80)
 
 
-def download_class(session, args, class_name):
+def download_class(session, args, class_name, syllabus=None):
     """
     Try to download on-demand class.
 
+    @param syllabus: @see download_on_demand_class
+
     @return: Tuple of (bool, bool), where the first bool indicates whether
         errors occurred while parsing syllabus, the second bool indicates
         whether the course appears to be completed.
     @rtype: (bool, bool)
     """
     logging.debug('Downloading new style (on demand) class %s', class_name)
-    return download_on_demand_class(session, args, class_name)
+    return download_on_demand_class(session, args, class_name, syllabus)
+
+
+def _iter_prefetched_syllabi(session, args, class_names):
+    """
+    Generate (class_name, prefetch) pairs in order. While a class is being
+    processed by the consumer, the syllabus of the next class is extracted
+    in a background thread; `prefetch` is the AsyncResult of that
+    extraction (None for the first class which is streamed as usual).
+    Errors of a prefetch (e.g. ClassNotFound) are raised by its `get`.
+    """
+    with worker_pool(1) as pool:
+        prefetch = None
+        for index, class_name in enumerate(class_names):
+            next_prefetch = None
+            if index + 1 < len(class_names):
+                next_prefetch = pool.apply_async(
+                    lambda name: CourseSyllabus(session, args,
+                                                name).prefetch(),
+                    (class_names[index + 1],))
+            yield class_name, prefetch
+            prefetch = next_prefetch
 
 
 def main_f(cmd):
@@ -260,6 +477,7 @@ def main_f(cmd):
     # ==================
     args = parse_args(cmd)
     # ===================
+    set_html_parser(args.html_parser)
     logging.info('>> COURSERA FULL COURSE DOWNLOADER\n')
     completed_classes = []
     classes_with_errors = []
@@ -275,14 +493,17 @@ def main_f(cmd):
     session = create_session(args)
 
     if args.specialization:
-        args.class_names = expand_specializations(session, args.class_names)
+        args.class_names = expand_specializations(
+            session, args.class_names, _get_jobs(args, args.extract_jobs))
 
-    for class_index, class_name in enumerate(args.class_names):
+    syllabi = _iter_prefetched_syllabi(session, args, args.class_names)
+    for class_index, (class_name, prefetch) in enumerate(syllabi):
         try:
             logging.info('Downloading class: %s (%d / %d)',
                          class_name, class_index + 1, len(args.class_names))
+            syllabus = prefetch.get() if prefetch is not None else None
             error_occurred, completed = download_class(
-                session, args, class_name)
+                session, args, class_name, syllabus)
             if completed:
                 completed_classes.append(class_name)
             if error_occurred:
@@ -329,3 +550,13 @@ def main_f(cmd):
         for class_name in classes_with_errors:
             logging.info('%s (https://www.coursera.org/learn/%s)',
                          class_name, class_name)
+
+    session.request_cache.report()
+    session.asset_cache.report()
+    session.connection_stats.report()
+    if getattr(session, 'retry_policy', None) is not None:
+        session.retry_policy.report()
+    if getattr(session, 'adaptive_concurrency', None) is not None:
+        session.adaptive_concurrency.report()
+    if getattr(session, 'http_cache', None) is not None:
+        session.http_cache.report()
@@ -187,6 +187,14 @@ OPENCOURSE_ASSETS_URL = \
 OPENCOURSE_API_ASSETS_V1_URL = \
     'https://api.coursera.org/api/assets.v1?ids={id}'
 
+# assets.v1 accepts a comma-separated list of ids; requests are split into
+# chunks so that the resulting URL does not exceed this length
+OPENCOURSE_API_ASSETS_V1_MAX_URL_LENGTH = 2000
+
+# Signed asset URLs that expire within this number of seconds are
+# re-resolved right before they are downloaded
+SIGNED_URL_EXPIRY_MARGIN = 300
+
 OPENCOURSE_ONDEMAND_COURSE_MATERIALS = \
     'https://api.coursera.org/api/onDemandCourseMaterials.v1/?'\
     'q=slug&slug={class_name}&includes=moduleIds%2ClessonIds%2CpassableItemGroups%2CpassableItemGroupChoices%2CpassableLessonElements%2CitemIds%2Ctracks'\
@@ -908,6 +916,18 @@ else:
 
 PATH_CACHE = os.path.join(tempfile.gettempdir(), _USER + "_coursera_dl_cache")
 PATH_COOKIES = os.path.join(PATH_CACHE, 'cookies')
+PATH_HTTP_CACHE = os.path.join(PATH_CACHE, 'http')
+PATH_ITEMS_CACHE = os.path.join(PATH_CACHE, 'items')
+PATH_SYLLABUS_CACHE = os.path.join(PATH_CACHE, 'syllabus')
+PATH_QUIZ_CACHE = os.path.join(PATH_CACHE, 'quizzes')
+
+# Version of the parsed syllabus format stored in PATH_SYLLABUS_CACHE,
+# must be increased whenever the format changes
+SYLLABUS_CACHE_VERSION = 4
+
+# Version of the item links stored in PATH_ITEMS_CACHE, must be increased
+# whenever extracted links change
+ITEMS_CACHE_VERSION = 2
 
 WINDOWS_UNC_PREFIX = u'\\\\?\\'
 
@@ -920,6 +940,11 @@ IN_MEMORY_EXTENSION = 'html'
 #: field first.
 IN_MEMORY_MARKER = '#inmemory#'
 
+#: This marker is added in front of a subtitles URL when the transcript
+#: of a lecture is derived locally from its subtitles instead of being
+#: downloaded. The marker should be removed from URL field first.
+TRANSCRIPT_MARKER = '#transcript#'
+
 #: These are hard limits for format (file extension) and
 #: title (file name) lengths to avoid too long file names
 #: (longer than 255 characters)
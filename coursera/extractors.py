@@ -6,14 +6,19 @@ to parse course syllabus.
 """
 
 import abc
-import json
 import logging
+import threading
 
+from . import jsoncodec
 from .api import (CourseraOnDemand, OnDemandCourseMaterialItemsV1,
-                 ModulesV1, LessonsV1, ItemsV2)
-from .define import OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2
+                  ModulesV1, LessonsV1, ItemsV2, ResolutionPlanner)
+from .cache import ItemLinksCache, RenderedQuizCache
+from .define import (OPENCOURSE_ONDEMAND_COURSE_MATERIALS_V2,
+                     PATH_ITEMS_CACHE, PATH_QUIZ_CACHE)
 from .network import get_page
-from .utils import is_debug_run, spit_json
+from .parallel import budgeted, imap_ordered
+from .syllabus import Module, Section, Lecture
+from .utils import is_debug_run, spit_json, get_html_parser
 
 
 class PlatformExtractor(object):
@@ -26,9 +31,25 @@ class PlatformExtractor(object):
         pass
 
 
+class ModuleStream(object):
+    """
+    Iterable of parsed modules that are generated while the syllabus is
+    still being extracted. `error_occurred` is final once the stream is
+    exhausted.
+    """
+
+    def __init__(self, modules):
+        self._modules = modules
+        self.error_occurred = False
+
+    def __iter__(self):
+        self.error_occurred = yield from self._modules
+
+
 class CourseraExtractor(PlatformExtractor):
     def __init__(self, session):
         self._notebook_downloaded = False
+        self._notebook_lock = threading.Lock()
         self._session = session
 
     def list_courses(self):
@@ -47,17 +68,47 @@ class CourseraExtractor(PlatformExtractor):
                     reverse=False, unrestricted_filenames=False,
                     subtitle_language='en', video_resolution=None,
                     download_quizzes=False, mathjax_cdn_url=None,
-                    download_notebooks=False):
+                    download_notebooks=False, extract_jobs=1,
+                    incremental=False, sidecar_assets_path=None,
+                    video_budget=None, local_transcripts=False,
+                    cache_quizzes=False, quiz_jobs=None):
 
         page = self._get_on_demand_syllabus(class_name)
         error_occurred, modules = self._parse_on_demand_syllabus(
             class_name,
             page, reverse, unrestricted_filenames,
             subtitle_language, video_resolution,
-            download_quizzes, mathjax_cdn_url, download_notebooks)
+            download_quizzes, mathjax_cdn_url, download_notebooks,
+            extract_jobs, incremental, sidecar_assets_path, video_budget,
+            local_transcripts, cache_quizzes, quiz_jobs)
 
         return error_occurred, modules
 
+    def stream_modules(self, class_name,
+                       reverse=False, unrestricted_filenames=False,
+                       subtitle_language='en', video_resolution=None,
+                       download_quizzes=False, mathjax_cdn_url=None,
+                       download_notebooks=False, extract_jobs=1,
+                       incremental=False, sidecar_assets_path=None,
+                       video_budget=None, local_transcripts=False,
+                       cache_quizzes=False, quiz_jobs=None):
+        """
+        Same as get_modules, but modules are produced one by one as soon as
+        all their lectures are resolved, so they can be downloaded while
+        the rest of the syllabus is still being extracted.
+
+        @return: Stream of parsed modules.
+        @rtype: ModuleStream
+        """
+        page = self._get_on_demand_syllabus(class_name)
+        return ModuleStream(self._iter_on_demand_syllabus(
+            class_name,
+            page, reverse, unrestricted_filenames,
+            subtitle_language, video_resolution,
+            download_quizzes, mathjax_cdn_url, download_notebooks,
+            extract_jobs, incremental, sidecar_assets_path, video_budget,
+            local_transcripts, cache_quizzes, quiz_jobs, streaming=True))
+
     def _get_on_demand_syllabus(self, class_name):
         """
         Get the on-demand course listing webpage.
@@ -76,18 +127,74 @@ class CourseraExtractor(PlatformExtractor):
                                   video_resolution=None,
                                   download_quizzes=False,
                                   mathjax_cdn_url=None,
-                                  download_notebooks=False
-                                  ):
+                                  download_notebooks=False,
+                                  extract_jobs=1,
+                                  incremental=False,
+                                  sidecar_assets_path=None,
+                                  video_budget=None,
+                                  local_transcripts=False,
+                                  cache_quizzes=False,
+                                  quiz_jobs=None):
         """
         Parse a Coursera on-demand course listing/syllabus page.
 
         @return: Tuple of (bool, list), where bool indicates whether
             there was at least on error while parsing syllabus, the list
             is a list of parsed modules.
-        @rtype: (bool, list)
+        @rtype: (bool, [syllabus.Module])
+        """
+        stream = ModuleStream(self._iter_on_demand_syllabus(
+            course_name, page, reverse, unrestricted_filenames,
+            subtitle_language, video_resolution, download_quizzes,
+            mathjax_cdn_url, download_notebooks, extract_jobs, incremental,
+            sidecar_assets_path, video_budget, local_transcripts,
+            cache_quizzes, quiz_jobs))
+        modules = list(stream)
+
+        return stream.error_occurred, modules
+
+    def _iter_on_demand_syllabus(self, course_name, page, reverse=False,
+                                 unrestricted_filenames=False,
+                                 subtitle_language='en',
+                                 video_resolution=None,
+                                 download_quizzes=False,
+                                 mathjax_cdn_url=None,
+                                 download_notebooks=False,
+                                 extract_jobs=1,
+                                 incremental=False,
+                                 sidecar_assets_path=None,
+                                 video_budget=None,
+                                 local_transcripts=False,
+                                 cache_quizzes=False,
+                                 quiz_jobs=None,
+                                 streaming=False):
+        """
+        Parse a Coursera on-demand course listing/syllabus page and
+        generate parsed modules.
+
+        Lectures are resolved by a pool of `extract_jobs` worker threads;
+        the order of modules, sections and lectures is preserved. In
+        `incremental` mode, items that did not change since the previous
+        run reuse their stored links instead of being extracted again.
+
+        Unless `streaming` is set, all lectures of the course are resolved
+        before the first module is generated, which allows to resolve
+        lecture assets of the whole course in bulk. In `streaming` mode
+        every module is generated as soon as its lectures are resolved
+        (unless `reverse` is set, which needs the whole list).
+
+        If `video_budget` (in bytes) is given, the resolution of every
+        lecture video is chosen so that the videos of the whole course fit
+        the budget, with `video_resolution` as the highest resolution
+        considered (@see ResolutionPlanner). The plan needs all lectures,
+        so modules are not generated before the whole course is resolved.
+
+        @return: Generator of parsed modules, its return value indicates
+            whether there was at least one error while parsing syllabus.
+        @rtype: generator
         """
 
-        dom = json.loads(page)
+        dom = jsoncodec.loads(page)
         class_id = dom['elements'][0]['id']
 
         logging.info('Parsing syllabus of on-demand course (id=%s). '
@@ -96,11 +203,31 @@ class CourseraExtractor(PlatformExtractor):
         modules = []
 
         json_modules = dom['linked']['onDemandCourseMaterialItems.v2']
+        resolution_planner = None
+        if video_budget is not None:
+            resolution_planner = ResolutionPlanner(
+                self._session, video_budget, video_resolution, extract_jobs)
+            streaming = False
+
+        quiz_cache = None
+        if cache_quizzes:
+            quiz_cache = RenderedQuizCache(
+                PATH_QUIZ_CACHE,
+                {'mathjax_cdn_url': mathjax_cdn_url,
+                 'sidecar_assets_path': sidecar_assets_path,
+                 'html_parser': get_html_parser()})
+
         course = CourseraOnDemand(
             session=self._session, course_id=class_id,
             course_name=course_name,
             unrestricted_filenames=unrestricted_filenames,
-            mathjax_cdn_url=mathjax_cdn_url)
+            mathjax_cdn_url=mathjax_cdn_url,
+            batch_lecture_assets=True,
+            sidecar_assets_path=sidecar_assets_path,
+            resolution_planner=resolution_planner,
+            local_transcripts=local_transcripts,
+            quiz_cache=quiz_cache,
+            quiz_jobs=quiz_jobs)
         course.obtain_user_id()
         ondemand_material_items = OnDemandCourseMaterialItemsV1.create(
             session=self._session, course_name=course_name)
@@ -111,8 +238,6 @@ class CourseraExtractor(PlatformExtractor):
             spit_json(ondemand_material_items._items,
                       '%s-course-material-items.json' % course_name)
 
-        error_occurred = False
-
         all_modules = ModulesV1.from_json(
             dom['linked']['onDemandCourseMaterialModules.v1'])
         all_lessons = LessonsV1.from_json(
@@ -120,12 +245,15 @@ class CourseraExtractor(PlatformExtractor):
         all_items = ItemsV2.from_json(
             dom['linked']['onDemandCourseMaterialItems.v2'])
 
+        # Build the syllabus plan first (module -> sections -> lectures),
+        # then resolve all lectures at once, then put the results back
+        # into the very same order.
+        plan = []
         for module in all_modules:
             logging.info('Processing module  %s', module.slug)
-            lessons = []
+            sections = []
             for section in module.children(all_lessons):
                 logging.info('Processing section     %s', section.slug)
-                lectures = []
                 available_lectures = section.children(all_items)
 
                 # Certain modules may be empty-looking programming assignments
@@ -134,88 +262,95 @@ class CourseraExtractor(PlatformExtractor):
                 if not available_lectures:
                     lecture = ondemand_material_items.get(section.id)
                     if lecture is not None:
-                        available_lectures = [lecture]
-
-                for lecture in available_lectures:
-                    typename = lecture.type_name
-
-                    logging.info('Processing lecture         %s (%s)',
-                                 lecture.slug, typename)
-                    # Empty dictionary means there were no data
-                    # None means an error occurred
-                    links = {}
-
-                    if typename == 'lecture':
-                        # lecture_video_id = lecture['content']['definition']['videoId']
-                        # assets = lecture['content']['definition'].get(
-                        #     'assets', [])
-                        lecture_video_id = lecture.id
-                        # assets = []
-
-                        links = course.extract_links_from_lecture(
-                            class_id,
-                            lecture_video_id, subtitle_language,
-                            video_resolution)
-
-                    elif typename == 'supplement':
-                        links = course.extract_links_from_supplement(
-                            lecture.id)
-
-                    elif typename == 'phasedPeer':
-                        links = course.extract_links_from_peer_assignment(
-                            lecture.id)
-
-                    elif typename in ('gradedProgramming', 'ungradedProgramming'):
-                        links = course.extract_links_from_programming(
-                            lecture.id)
-
-                    elif typename == 'quiz':
-                        if download_quizzes:
-                            links = course.extract_links_from_quiz(
-                                lecture.id)
-                            
-                    elif typename == 'staffGraded':
-                        logging.info(
-                            'Staff graded assignment skipped: "%s" in lecture "%s" (lecture id "%s")',
-                            lecture.slug, lecture.slug, lecture.id)
-
-                    elif typename == 'exam':
-                        if download_quizzes:
-                            links = course.extract_links_from_exam(
-                                lecture.id)
-
-                    elif typename == 'programming':
-                        if download_quizzes:
-                            links = course.extract_links_from_programming_immediate_instructions(
-                                lecture.id)
-
-                    elif typename == 'notebook':
-                        if download_notebooks and not self._notebook_downloaded:
-                            logging.warning(
-                                'According to notebooks platform, content will be downloaded first')
-                            links = course.extract_links_from_notebook(
-                                lecture.id)
-                            self._notebook_downloaded = True
-
-                    else:
-                        logging.info(
-                            'Unsupported typename "%s" in lecture "%s" (lecture id "%s")',
-                            typename, lecture.slug, lecture.id)
-                        continue
+                        available_lectures = list(
+                            ItemsV2.from_json([lecture]).children.values())
+
+                sections.append((section, available_lectures))
+            plan.append((module, sections))
+
+        item_cache = None
+        if incremental:
+            item_cache = ItemLinksCache(
+                PATH_ITEMS_CACHE, course_name,
+                {'subtitle_language': subtitle_language,
+                 'video_resolution': video_resolution,
+                 'download_quizzes': download_quizzes,
+                 'unrestricted_filenames': unrestricted_filenames,
+                 'mathjax_cdn_url': mathjax_cdn_url,
+                 'sidecar_assets_path': sidecar_assets_path,
+                 'video_budget': video_budget,
+                 'local_transcripts': local_transcripts,
+                 'html_parser': get_html_parser()})
+
+        def extract_links(lecture):
+            if item_cache is not None and lecture.type_name != 'notebook':
+                links = item_cache.get(lecture)
+                if links is not None:
+                    return links
+
+            return self._extract_links_from_item(
+                course, class_id, lecture, subtitle_language,
+                video_resolution, download_quizzes, download_notebooks)
+
+        all_lectures = [lecture
+                        for _module, sections in plan
+                        for _section, lectures in sections
+                        for lecture in lectures]
+        results = self._imap(extract_links, all_lectures, extract_jobs)
+        error_occurred = False
+
+        if not streaming:
+            # Lecture assets of the whole course are resolved in bulk and
+            # added to the lecture links collected above
+            results = list(results)
+            course.plan_video_resolutions()
+            error_occurred = not course.resolve_lecture_assets()
+        results = iter(results)
 
+        for module, sections in plan:
+            module_links = [[next(results) for _lecture in lectures]
+                            for _section, lectures in sections]
+            if streaming and not course.resolve_lecture_assets():
+                error_occurred = True
+
+            lessons = []
+            for (section, available_lectures), section_links in \
+                    zip(sections, module_links):
+                lectures = []
+                for lecture, links in zip(available_lectures, section_links):
                     if links is None:
                         error_occurred = True
-                    elif links:
-                        lectures.append((lecture.slug, links))
+                        continue
+
+                    # Links that lack the assets of a failed bulk request
+                    # are not stored, so the next run extracts them again
+                    if item_cache is not None and \
+                            lecture.type_name != 'notebook' and \
+                            not course.has_unresolved_assets(links):
+                        item_cache.put(lecture, links)
+                    if links:
+                        lectures.append(Lecture.from_links(lecture.slug,
+                                                           links))
 
                 if lectures:
-                    lessons.append((section.slug, lectures))
+                    lessons.append(Section(section.slug, lectures))
+
+            if not lessons:
+                continue
+            if reverse:
+                modules.append(Module(module.slug, lessons))
+            else:
+                yield Module(module.slug, lessons)
 
-            if lessons:
-                modules.append((module.slug, lessons))
+        if item_cache is not None:
+            item_cache.save()
+        if quiz_cache is not None:
+            quiz_cache.report()
 
         if modules and reverse:
             modules.reverse()
+        for module in modules:
+            yield module
 
         # Processing resources section
         json_references = course.extract_references_poll()
@@ -229,16 +364,111 @@ class CourseraExtractor(PlatformExtractor):
                              reference_slug)
 
                 links = course.extract_links_from_reference(
-                    json_reference['shortId'])
+                    json_reference['shortId'], json_reference)
                 if links is None:
                     error_occurred = True
                 elif links:
-                    reference.append(('', links))
+                    reference.append(Lecture.from_links('', links))
 
                 if reference:
-                    references.append((reference_slug, reference))
+                    references.append(Section(reference_slug, reference))
+
+            logging.info('Resources: %d built from the references poll, '
+                         '%d requested on their own',
+                         course.polled_references,
+                         course.requested_references)
 
         if references:
-            modules.append(("Resources", references))
+            yield Module('Resources', references)
 
-        return error_occurred, modules
+        return error_occurred
+
+    def _imap(self, function, items, jobs):
+        """
+        Apply function to every element of items using up to `jobs`
+        worker threads. Results are generated in the order of items as soon
+        as they are available. Every call holds a slot of the session's
+        concurrency budget.
+        """
+        return imap_ordered(budgeted(self._session, function), items, jobs)
+
+    def _extract_links_from_item(self, course, class_id, lecture,
+                                 subtitle_language, video_resolution,
+                                 download_quizzes, download_notebooks):
+        """
+        Extract links from a single syllabus item (lecture, supplement,
+        quiz and so on).
+
+        @return: Links of the item, empty dictionary if there is nothing
+            to download and None if an error occurred.
+        @rtype: @see CourseraOnDemand._extract_links_from_text
+        """
+        typename = lecture.type_name
+
+        logging.info('Processing lecture         %s (%s)',
+                     lecture.slug, typename)
+        # Empty dictionary means there were no data
+        # None means an error occurred
+        links = {}
+
+        if typename == 'lecture':
+            # lecture_video_id = lecture['content']['definition']['videoId']
+            # assets = lecture['content']['definition'].get(
+            #     'assets', [])
+            lecture_video_id = lecture.id
+            # assets = []
+
+            links = course.extract_links_from_lecture(
+                class_id,
+                lecture_video_id, subtitle_language,
+                video_resolution)
+
+        elif typename == 'supplement':
+            links = course.extract_links_from_supplement(
+                lecture.id)
+
+        elif typename == 'phasedPeer':
+            links = course.extract_links_from_peer_assignment(
+                lecture.id)
+
+        elif typename in ('gradedProgramming', 'ungradedProgramming'):
+            links = course.extract_links_from_programming(
+                lecture.id)
+
+        elif typename == 'quiz':
+            if download_quizzes:
+                links = course.extract_links_from_quiz(
+                    lecture.id, lecture)
+
+        elif typename == 'staffGraded':
+            logging.info(
+                'Staff graded assignment skipped: "%s" in lecture "%s" (lecture id "%s")',
+                lecture.slug, lecture.slug, lecture.id)
+
+        elif typename == 'exam':
+            if download_quizzes:
+                links = course.extract_links_from_exam(
+                    lecture.id, lecture)
+
+        elif typename == 'programming':
+            if download_quizzes:
+                links = course.extract_links_from_programming_immediate_instructions(
+                    lecture.id)
+
+        elif typename == 'notebook':
+            # Only the first notebook item is downloaded, make sure
+            # concurrent workers agree on which one it is
+            with self._notebook_lock:
+                if download_notebooks and not self._notebook_downloaded:
+                    logging.warning(
+                        'According to notebooks platform, content will be downloaded first')
+                    links = course.extract_links_from_notebook(
+                        lecture.id)
+                    self._notebook_downloaded = True
+
+        else:
+            logging.info(
+                'Unsupported typename "%s" in lecture "%s" (lecture id "%s")',
+                typename, lecture.slug, lecture.id)
+
+        return links
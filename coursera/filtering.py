@@ -83,6 +83,12 @@ def skip_format_url(format_, url):
 def find_resources_to_get(lecture, file_formats, resource_filter, ignored_formats=None):
     """
     Select formats to download.
+
+    @param lecture: Lecture of the syllabus.
+    @type lecture: syllabus.Lecture
+
+    @return: Resources to download.
+    @rtype: [(fmt, url, title, expiry)]
     """
     resources_to_get = []
 
@@ -92,7 +98,7 @@ def find_resources_to_get(lecture, file_formats, resource_filter, ignored_format
     if len(ignored_formats):
         logging.info("The following file formats will be ignored: " + ",".join(ignored_formats))
 
-    for fmt, resources in lecture.items():
+    for fmt, resources in lecture.groups():
         fmt0 = fmt
 
         short_fmt = None
@@ -104,11 +110,11 @@ def find_resources_to_get(lecture, file_formats, resource_filter, ignored_format
 
         if fmt in file_formats or (short_fmt != None and short_fmt in file_formats) or 'all' in file_formats:
             for r in resources:
-                if resource_filter and r[1] and not re.search(resource_filter, r[1]):
+                if resource_filter and r.title and not re.search(resource_filter, r.title):
                     logging.debug('Skipping b/c of rf: %s %s',
-                                  resource_filter, r[1])
+                                  resource_filter, r.title)
                     continue
-                resources_to_get.append((fmt0, r[0], r[1]))
+                resources_to_get.append((fmt0, r.url, r.title, r.expiry))
         else:
             logging.debug(
                 'Skipping b/c format %s not in %s', fmt, file_formats)
@@ -0,0 +1,92 @@
+"""
+This module contains the JSON codec used for API replies and on-disk
+caches. It uses the fastest available backend: orjson, ujson or the
+standard json module, in this order.
+
+Serialization that must stay stable between runs and backends (e.g.
+cache keys and fingerprints) should keep using the standard json module.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+elif ujson is not None:
+    BACKEND = 'ujson'
+else:
+    BACKEND = 'json'
+
+
+def loads(data):
+    """
+    Deserialize a JSON document.
+
+    @param data: JSON document, bytes are expected to be UTF-8 encoded.
+    @type data: str or bytes
+
+    @return: Deserialized object.
+    @rtype: object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if ujson is not None:
+        return ujson.loads(data)
+    return json.loads(data)
+
+
+def dumpb(obj, indent=False):
+    """
+    Serialize an object to a UTF-8 encoded JSON document.
+
+    @param obj: Object to serialize. Dictionary keys must be strings.
+    @type obj: object
+
+    @param indent: Flag that tells whether the document should be
+        pretty-printed (the indentation width depends on the backend).
+    @type indent: bool
+
+    @return: JSON document.
+    @rtype: bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return dumps(obj, indent).encode('utf-8')
+
+
+def dumps(obj, indent=False):
+    """
+    Serialize an object to a JSON document, @see dumpb.
+
+    @rtype: str
+    """
+    if orjson is not None:
+        return dumpb(obj, indent).decode('utf-8')
+    if ujson is not None:
+        return ujson.dumps(obj, indent=4 if indent else 0,
+                           ensure_ascii=False, escape_forward_slashes=False)
+    return json.dumps(obj, indent=4 if indent else None, ensure_ascii=False)
+
+
+def load(file_object):
+    """
+    Deserialize a JSON document from a file opened in binary mode.
+    """
+    return loads(file_object.read())
+
+
+def dump(obj, file_object, indent=False):
+    """
+    Serialize an object to a file opened in binary mode, @see dumpb.
+    """
+    file_object.write(dumpb(obj, indent))
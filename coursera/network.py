@@ -4,12 +4,315 @@ some data and so on.
 """
 
 import json
+import time
+import random
 import logging
+import threading
+import email.utils
+
+from collections import OrderedDict
 
 import requests
 
+from . import jsoncodec
+
+
+class _Flight(object):
+    """
+    A request that is currently in flight. Threads that ask for the same
+    request wait for the flight to land and share its outcome.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.reply = None
+        self.error = None
+
+
+class RequestCache(object):
+    """
+    Per-session request de-duplication layer. Identical GET requests that
+    are in flight at the same time are coalesced into a single request and
+    completed JSON replies are memoized for the rest of the run.
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        @param max_entries: Maximum number of memoized replies; the least
+            recently used reply is dropped when the limit is exceeded.
+        @type max_entries: int
+        """
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._replies = OrderedDict()
+        self._flights = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def fetch(self, key, send):
+        """
+        Return a reply for the request identified by `key`, calling `send`
+        only if neither a memoized reply nor an identical request in flight
+        is available.
+
+        @param key: Hashable request identity.
+        @type key: tuple
+
+        @param send: Function that performs the request and returns
+            a reply (or raises).
+        @type send: callable() -> requests.Response
+
+        @return: Requests response.
+        @rtype: requests.Response
+        """
+        with self._lock:
+            if key in self._replies:
+                self._replies.move_to_end(key)
+                self.hits += 1
+                return self._replies[key]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.reply
+
+        try:
+            flight.reply = send()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and self._is_memoizable(flight.reply):
+                    self._replies[key] = flight.reply
+                    if len(self._replies) > self._max_entries:
+                        self._replies.popitem(last=False)
+            flight.done.set()
+
+        return flight.reply
+
+    def _is_memoizable(self, reply):
+        content_type = reply.headers.get('Content-Type', '')
+        return (reply.status_code == 200 and
+                content_type.startswith('application/json'))
+
+    def report(self):
+        logging.info('Request cache: %d hits, %d misses, %d coalesced',
+                     self.hits, self.misses, self.coalesced)
+
+
+class RetryPolicy(object):
+    """
+    Retry policy of get_reply for transient failures. Connection errors,
+    timeouts, 429 Too Many Requests and 5xx replies are retried with
+    exponential backoff and full jitter, or after the delay the server
+    asks for in its Retry-After header.
+
+    The policy is shared by all workers of a session (`retry_policy`
+    session attribute): a 429 reply pauses every request of the session
+    until the delay has passed, instead of each thread retrying against
+    the rate limit on its own. POST requests are only retried on 429,
+    where the server is known not to have processed them.
+    """
+
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_retries=3, backoff=1.0, max_delay=60.0):
+        """
+        @param max_retries: Maximum number of retries of a request.
+        @type max_retries: int
+
+        @param backoff: Upper bound of the first retry delay in seconds;
+            the bound doubles with every further retry.
+        @type backoff: float
+
+        @param max_delay: Maximum delay before a retry in seconds.
+        @type max_delay: float
+        """
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        self._paused_until = 0
+
+        self.retries = 0
+        self.throttled = 0
+
+    def send(self, send, post=False):
+        """
+        Send a request, retrying it according to the policy.
+
+        @param send: Function that sends the request once.
+        @type send: callable() -> requests.Response
+
+        @param post: Flag that tells whether the request is a POST.
+        @type post: bool
+
+        @return: The first reply that is not retried.
+        @rtype: requests.Response
+        """
+        attempt = 0
+        while True:
+            self._wait()
+            try:
+                reply = send()
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                if post or attempt >= self._max_retries:
+                    raise
+                reason = str(e)
+                delay = self._backoff_delay(attempt)
+            else:
+                status_code = reply.status_code
+                if status_code not in self.RETRY_STATUS_CODES or \
+                        attempt >= self._max_retries or \
+                        (post and status_code != 429):
+                    return reply
+                reason = 'HTTP %d' % status_code
+                delay = self._retry_after(reply)
+                if delay is None:
+                    delay = self._backoff_delay(attempt)
+                reply.close()
+
+                if status_code == 429:
+                    # Everybody waits, see _wait
+                    self._pause(delay)
 
-def get_reply(session, url, post=False, data=None, headers=None, quiet=False):
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            logging.warning('%s, retrying in %.1f seconds (%d/%d)',
+                            reason, delay, attempt, self._max_retries)
+            if not self._is_paused():
+                time.sleep(delay)
+
+    def report(self):
+        logging.info('Retries: %d requests retried, %d rate limit pauses',
+                     self.retries, self.throttled)
+
+    def _backoff_delay(self, attempt):
+        return random.uniform(
+            0, min(self._max_delay, self._backoff * 2 ** attempt))
+
+    def _retry_after(self, reply):
+        value = reply.headers.get('Retry-After')
+        if not value:
+            return None
+
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                date = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            delay = date.timestamp() - time.time()
+
+        return min(max(delay, 0), self._max_delay)
+
+    def _pause(self, delay):
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.time() + delay)
+
+    def _is_paused(self):
+        with self._lock:
+            return self._paused_until > time.time()
+
+    def _wait(self):
+        while True:
+            with self._lock:
+                delay = self._paused_until - time.time()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+
+class ConnectionStats(object):
+    """
+    Per-host counters of HTTP connections: connections that were opened,
+    requests that were sent over an already open (kept alive) connection
+    and connections that were closed on return because the pool of the
+    host was full. Counters are updated by the pools of TLSAdapter, @see
+    counting_pool_classes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def count(self, host, counter):
+        """
+        @param counter: One of 'opened', 'requests' and 'discarded'.
+        @type counter: str
+        """
+        with self._lock:
+            counters = self._hosts.setdefault(
+                host, {'opened': 0, 'requests': 0, 'discarded': 0})
+            counters[counter] += 1
+
+    def report(self):
+        with self._lock:
+            hosts = sorted(self._hosts.items())
+        for host, counters in hosts:
+            logging.info('Connections to %s: %d new, %d reused, '
+                         '%d discarded', host, counters['opened'],
+                         max(counters['requests'] - counters['opened'], 0),
+                         counters['discarded'])
+
+
+def counting_pool_classes(stats):
+    """
+    Return urllib3 connection pool classes (by URL scheme) that update
+    the given connection counters.
+
+    @param stats: Counters to update.
+    @type stats: ConnectionStats
+
+    @rtype: {str: type}
+    """
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def make_pool_class(pool_class):
+        class CountingConnection(pool_class.ConnectionCls):
+            def connect(self):
+                stats.count(self.host, 'opened')
+                return super(CountingConnection, self).connect()
+
+        class CountingConnectionPool(pool_class):
+            ConnectionCls = CountingConnection
+
+            def urlopen(self, *args, **kwargs):
+                stats.count(self.host, 'requests')
+                return super(CountingConnectionPool, self).urlopen(
+                    *args, **kwargs)
+
+            def _put_conn(self, conn):
+                # A full pool closes the connection instead of keeping it
+                if conn is not None and self.pool is not None and \
+                        self.pool.full():
+                    stats.count(self.host, 'discarded')
+                super(CountingConnectionPool, self)._put_conn(conn)
+
+        return CountingConnectionPool
+
+    return {'http': make_pool_class(HTTPConnectionPool),
+            'https': make_pool_class(HTTPSConnectionPool)}
+
+
+def get_reply(session, url, post=False, data=None, headers=None, quiet=False,
+              cache=True):
     """
     Download an HTML page using the requests session. Low-level function
     that allows for flexible request configuration.
@@ -33,29 +336,67 @@ def get_reply(session, url, post=False, data=None, headers=None, quiet=False):
         code != 200.
     @type quiet: bool
 
+    @param cache: Flag that tells whether the reply may be served from
+        (and stored in) the request and HTTP caches. Replies that carry
+        short-lived data, e.g. signed URLs, are requested with cache=False.
+    @type cache: bool
+
     @return: Requests response.
     @rtype: requests.Response
     """
 
     request_headers = {} if headers is None else headers
+    controller = getattr(session, 'adaptive_concurrency', None)
+
+    def send(extra_headers=None):
+        all_headers = dict(request_headers)
+        all_headers.update(extra_headers or {})
+
+        request = requests.Request('POST' if post else 'GET',
+                                   url,
+                                   data=data,
+                                   headers=all_headers)
+        prepared_request = session.prepare_request(request)
 
-    request = requests.Request('POST' if post else 'GET',
-                               url,
-                               data=data,
-                               headers=request_headers)
-    prepared_request = session.prepare_request(request)
+        def send_once():
+            if controller is None:
+                return session.send(prepared_request)
+            with controller.slot(prepared_request.url):
+                return session.send(prepared_request)
 
-    reply = session.send(prepared_request)
+        retry_policy = getattr(session, 'retry_policy', None)
+        if retry_policy is None:
+            reply = send_once()
+        else:
+            reply = retry_policy.send(send_once, post)
 
-    try:
-        reply.raise_for_status()
-    except requests.exceptions.HTTPError as e:
-        # if not quiet:
-        #     logging.error("Error %s getting page %s", e, url)
-        #     logging.error("The server replied: %s", reply.text)
-        raise
+        try:
+            reply.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            # if not quiet:
+            #     logging.error("Error %s getting page %s", e, url)
+            #     logging.error("The server replied: %s", reply.text)
+            raise
 
-    return reply
+        return reply
+
+    def send_cached():
+        # Persistent cache revalidates stored replies with conditional
+        # requests, see HTTPCache
+        http_cache = getattr(session, 'http_cache', None)
+        if http_cache is None or not http_cache.accepts(url):
+            return send()
+        return http_cache.fetch(url, request_headers, send)
+
+    # Only GET requests are idempotent, POST requests always go through
+    request_cache = getattr(session, 'request_cache', None)
+    if post or not cache:
+        return send()
+    if request_cache is None:
+        return send_cached()
+
+    key = (url, tuple(sorted(request_headers.items())))
+    return request_cache.fetch(key, send_cached)
 
 
 def get_page(session,
@@ -65,6 +406,7 @@ def get_page(session,
              data=None,
              headers=None,
              quiet=False,
+             cache=True,
              **kwargs):
     """
     Download an HTML page using the requests session.
@@ -84,13 +426,16 @@ def get_page(session,
     @param headers: Additional headers to send with request.
     @type headers: dict
 
+    @param cache: @see get_reply
+    @type cache: bool
+
     @return: Response body.
     @rtype: str
     """
     url = url.format(**kwargs)
     reply = get_reply(session, url, post=post, data=data, headers=headers,
-                      quiet=quiet)
-    return reply.json() if json else reply.text
+                      quiet=quiet, cache=cache)
+    return jsoncodec.loads(reply.content) if json else reply.text
 
 
 def get_page_and_url(session, url):
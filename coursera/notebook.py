@@ -0,0 +1,205 @@
+"""
+This module contains the synchronization of Jupyter notebook workspaces:
+the contents tree of a workspace is crawled and its files are mirrored
+into a local directory.
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+
+import requests
+
+from .define import OPENCOURSE_NOTEBOOK_TREE, OPENCOURSE_NOTEBOOK_DOWNLOAD
+from .network import get_page
+from .parallel import map_ordered, Counters
+from .utils import clean_url, clean_filename, mkdir_p
+
+
+#: Size of chunks in which notebook files are written to disk
+CHUNK_SIZE = 65536
+
+
+def parse_timestamp(timestamp):
+    """
+    Parse an ISO 8601 timestamp of the Jupyter contents API, e.g.
+    '2020-01-31T12:34:56.789Z'.
+
+    @return: Seconds since the epoch or None if it cannot be parsed.
+    @rtype: float
+    """
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(
+            timestamp.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class NotebookSync(Counters):
+    """
+    Mirrors the contents of a Jupyter workspace into a local directory.
+    Directories are listed concurrently, level by level. A file is fetched
+    only if it does not exist locally, or if its size differs or it was
+    modified remotely after the local copy. Files are streamed to disk in
+    chunks over the session's connection pool.
+
+    The work is done by a private pool, not under the session's
+    concurrency budget: a sync runs within a syllabus extraction job that
+    already holds a slot of the budget.
+    """
+
+    def __init__(self, session, jupyter_id, path, jobs=4):
+        """
+        @param session: Requests session with the cookies of the notebook
+            hub.
+        @type session: requests.Session
+
+        @param jupyter_id: Jupyter user id of the workspace.
+        @type jupyter_id: str
+
+        @param path: Local directory that mirrors the workspace.
+        @type path: str
+
+        @param jobs: Number of concurrent requests.
+        @type jobs: int
+        """
+        self._session = session
+        self._jupyter_id = jupyter_id
+        self._path = path
+        self._jobs = jobs
+        self._lock = threading.Lock()
+
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def sync(self):
+        """
+        Synchronize the workspace.
+
+        @return: Links of workspace files grouped by extension, in the
+            order of the contents tree.
+        @rtype: @see CourseraOnDemand._extract_links_from_text
+        """
+        entries = self._crawl()
+
+        map_ordered(self._sync_file, entries, self._jobs)
+
+        logging.info('Notebook sync: %d files downloaded, %d up to date, '
+                     '%d failed', self.downloaded, self.skipped, self.failed)
+
+        supplement_links = {}
+        for entry in entries:
+            url = self._download_url(entry)
+            filename, extension = os.path.splitext(clean_url(url))
+            extension = 'ipynb' if entry['type'] == 'notebook' \
+                else str(extension[1:])
+            supplement_links.setdefault(extension, []).append(
+                (url.replace(' ', '%20'), filename))
+        return supplement_links
+
+    def _crawl(self):
+        """
+        List the contents tree.
+
+        @return: Files and notebooks in depth-first order.
+        @rtype: [dict]
+        """
+        listings = {}
+        level = ['/']
+
+        while level:
+            next_level = []
+            for path, contents in zip(level, map_ordered(
+                    self._list, level, self._jobs)):
+                listings[path] = contents
+                next_level.extend(content['path']
+                                  for content in contents
+                                  if content['type'] == 'directory')
+            level = next_level
+
+        entries = []
+        self._flatten(listings, '/', entries)
+        return entries
+
+    def _flatten(self, listings, path, entries):
+        for content in listings[path]:
+            if content['type'] == 'directory':
+                self._flatten(listings, content['path'], entries)
+            elif content['type'] in ('file', 'notebook'):
+                entries.append(content)
+            else:
+                logging.info(
+                    'Unsupported typename %s in notebook', content['type'])
+
+    def _list(self, path):
+        reply = get_page(self._session, OPENCOURSE_NOTEBOOK_TREE, json=True,
+                         jupId=self._jupyter_id, path=path,
+                         timestamp=int(time.time()))
+        return reply['content']
+
+    def _download_url(self, entry):
+        return OPENCOURSE_NOTEBOOK_DOWNLOAD.format(
+            path=entry['path'], jupId=self._jupyter_id,
+            timestamp=int(time.time()))
+
+    def _local_filename(self, entry):
+        head, tail = entry['path'].rsplit('/', 1) if '/' in entry['path'] \
+            else ('', entry['path'])
+        if entry['type'] == 'file':
+            # Remote paths always use '/' as the separator
+            head = '/'.join([clean_filename(directory, minimal_change=True)
+                             for directory in head.split('/')])
+            tail = clean_filename(tail, minimal_change=True)
+        return os.path.join(self._path, head, tail)
+
+    def _is_up_to_date(self, entry, filename):
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+
+        size = entry.get('size')
+        if size is not None and size != stat.st_size:
+            return False
+
+        modified = parse_timestamp(entry.get('last_modified'))
+        return modified is None or modified <= stat.st_mtime
+
+    def _sync_file(self, entry):
+        filename = self._local_filename(entry)
+        if self._is_up_to_date(entry, filename):
+            logging.info('Skipping %s... (file exists)', entry['path'])
+            self._count('skipped')
+            return
+
+        url = self._download_url(entry).replace(' ', '%20')
+        tmp_filename = '%s.%d.tmp' % (filename, threading.get_ident())
+        logging.info('Downloading %s into %s', entry['path'], self._path)
+        try:
+            mkdir_p(os.path.dirname(filename))
+            with self._session.get(url, stream=True) as reply:
+                reply.raise_for_status()
+                with open(tmp_filename, 'wb') as file_object:
+                    for chunk in reply.iter_content(CHUNK_SIZE):
+                        file_object.write(chunk)
+            os.replace(tmp_filename, filename)
+        except (requests.exceptions.RequestException, IOError,
+                OSError) as e:
+            logging.error('Could not download %s: %s', entry['path'], e)
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            self._count('failed')
+            return
+
+        # Remote modification time makes the next sync skip the file
+        modified = parse_timestamp(entry.get('last_modified'))
+        if modified is not None:
+            os.utime(filename, (modified, modified))
+        self._count('downloaded')
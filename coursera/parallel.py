@@ -1,7 +1,335 @@
 import abc
+import time
 import logging
+import threading
 import traceback
+import contextlib
 from multiprocessing.dummy import Pool
+from urllib.parse import urlparse
+
+import requests
+
+
+@contextlib.contextmanager
+def worker_pool(processes):
+    """
+    Thread pool that is closed when the block ends and whose workers are
+    stopped if the block is left early, e.g. by an exception or by the
+    consumer of a generator going away.
+    """
+    pool = Pool(processes=processes)
+    try:
+        yield pool
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def imap_ordered(function, items, jobs):
+    """
+    Apply function to every element of items using up to `jobs` worker
+    threads, or in the calling thread if there is nothing to parallelize.
+    Results are generated in the order of items as soon as they are
+    available.
+
+    @param items: Items, a sequence.
+    @type items: list
+
+    @rtype: generator
+    """
+    if jobs <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    with worker_pool(min(jobs, len(items))) as pool:
+        for result in pool.imap(function, items):
+            yield result
+
+
+def map_ordered(function, items, jobs):
+    """
+    Return the results of imap_ordered as a list.
+
+    @rtype: list
+    """
+    return list(imap_ordered(function, items, jobs))
+
+
+class Counters(object):
+    """
+    Mixin for statistics that are counted by several threads: counters
+    are plain attributes, subclasses provide `_lock`.
+    """
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+class ConcurrencyBudget(object):
+    """
+    Global limit on the number of work units (syllabus item extractions,
+    file downloads) that run at the same time across all pools. The budget
+    is shared through the `concurrency_budget` session attribute; every
+    work unit holds one slot while it runs.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._held = threading.local()
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        self._held.count = getattr(self._held, 'count', 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._held.count -= 1
+        self._semaphore.release()
+
+    @contextlib.contextmanager
+    def suspended(self):
+        """
+        Release the slots held by the current thread while it waits for
+        something else, e.g. an adaptive concurrency slot, so that waiting
+        threads do not starve running ones. The slots are taken again
+        afterwards.
+        """
+        count = getattr(self._held, 'count', 0)
+        for _ in range(count):
+            self._semaphore.release()
+        self._held.count = 0
+        try:
+            yield
+        finally:
+            for _ in range(count):
+                self._semaphore.acquire()
+            self._held.count = count
+
+
+def budgeted(session, function):
+    """
+    Wrap function so that every call holds a slot of the session's
+    concurrency budget (@see ConcurrencyBudget), if there is one.
+    """
+    budget = getattr(session, 'concurrency_budget', None)
+    if budget is None:
+        return function
+
+    def wrapper(*args, **kwargs):
+        with budget:
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+class AdaptiveLimit(object):
+    """
+    Limit on the number of in-flight requests of one host class, adjusted
+    by additive increase / multiplicative decrease (AIMD).
+
+    Every successful reply of a saturated class raises the limit by
+    1/limit, i.e. by about one request per round of `limit` replies, as
+    long as the smoothed latency stays within LATENCY_TOLERANCE times the
+    lowest smoothed latency seen. A 429 reply, a 5xx reply or a timeout
+    halves the limit, at most once per round trip: failures of requests
+    that were sent before the last decrease are ignored.
+    """
+
+    DECREASE_FACTOR = 0.5
+    LATENCY_TOLERANCE = 2.0
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, name, initial, maximum, minimum=1):
+        """
+        @param name: Name of the host class, used in logs.
+        @type name: str
+
+        @param initial: Initial limit.
+        @type initial: int
+
+        @param maximum: Maximum limit.
+        @type maximum: int
+
+        @param minimum: Minimum limit.
+        @type minimum: int
+        """
+        self.name = name
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.maximum = maximum
+        self.minimum = minimum
+        self.in_flight = 0
+        self.decreases = 0
+
+        self._condition = threading.Condition()
+        self._latency = None
+        self._baseline = None
+        self._last_decrease = 0
+
+    def acquire(self, blocking=True):
+        """
+        @return: True if a slot was taken, False if none is free and
+            `blocking` is not set.
+        @rtype: bool
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                if not blocking:
+                    return False
+                self._condition.wait()
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def success(self, latency):
+        """
+        Record a successful reply.
+
+        @param latency: Time until the reply headers arrived in seconds.
+        @type latency: float
+        """
+        with self._condition:
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += self.LATENCY_SMOOTHING * (
+                    latency - self._latency)
+            if self._baseline is None or self._latency < self._baseline:
+                self._baseline = self._latency
+
+            # Only a limit that is reached is known to be too low
+            if self.in_flight < int(self.limit) or \
+                    self._latency > self.LATENCY_TOLERANCE * self._baseline:
+                return
+
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def failure(self, started):
+        """
+        Record an overload signal: a 429 or 5xx reply or a timeout.
+
+        @param started: Time when the failed request was sent.
+        @type started: float
+        """
+        with self._condition:
+            if started < self._last_decrease:
+                return
+
+            self.limit = max(self.minimum, self.limit * self.DECREASE_FACTOR)
+            self.decreases += 1
+            self._last_decrease = time.time()
+        logging.debug('Concurrency limit of %s cut to %d',
+                      self.name, int(self.limit))
+
+
+class AdaptiveConcurrency(object):
+    """
+    Adaptive limits on in-flight requests for the API host and for the CDN
+    hosts that serve videos and other files, @see AdaptiveLimit. The
+    controller is shared through the `adaptive_concurrency` session
+    attribute; requests take a slot with `slot(url)`. Outcomes are taken
+    from every reply of the session, via a response hook installed by
+    `install`, and from timeouts and connection errors raised in a slot.
+    External downloaders do not use the session, so only their failures
+    to connect are seen.
+
+    Slots are reentrant per thread: a request made while the thread holds
+    a slot of the same host class, e.g. a refresh of a signed URL during a
+    download, belongs to the same unit of work and does not wait. A thread
+    that has to wait for a slot gives its slots of the session's
+    concurrency budget back meanwhile (@see ConcurrencyBudget.suspended).
+    """
+
+    API = 'api'
+    CDN = 'cdn'
+
+    API_DOMAIN = 'coursera.org'
+    OVERLOAD_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, api_jobs, cdn_jobs, maximum):
+        """
+        @param api_jobs: Initial limit of API requests.
+        @type api_jobs: int
+
+        @param cdn_jobs: Initial limit of CDN requests.
+        @type cdn_jobs: int
+
+        @param maximum: Maximum limit of either host class.
+        @type maximum: int
+        """
+        self._limits = {
+            self.API: AdaptiveLimit(self.API, api_jobs, maximum),
+            self.CDN: AdaptiveLimit(self.CDN, cdn_jobs, maximum)
+        }
+        self._held = threading.local()
+        self._budget = None
+
+    def install(self, session):
+        """
+        Share the controller through the session and observe its replies.
+
+        @type session: requests.Session
+        """
+        session.adaptive_concurrency = self
+        self._budget = getattr(session, 'concurrency_budget', None)
+        session.hooks['response'].append(self._observe)
+
+    def host_class(self, url):
+        hostname = urlparse(url).hostname or ''
+        if hostname == self.API_DOMAIN or \
+                hostname.endswith('.' + self.API_DOMAIN):
+            return self.API
+        return self.CDN
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        """
+        Hold a slot of the host class of url while the request runs.
+        """
+        host_class = self.host_class(url)
+        held = getattr(self._held, 'classes', None)
+        if held is None:
+            held = self._held.classes = set()
+        if host_class in held:
+            yield
+            return
+
+        limit = self._limits[host_class]
+        if not limit.acquire(blocking=False):
+            with self._budget.suspended() if self._budget is not None \
+                    else contextlib.nullcontext():
+                limit.acquire()
+        held.add(host_class)
+        started = time.time()
+        try:
+            yield
+        except (requests.exceptions.Timeout,
+                requests.exceptions.ConnectionError):
+            limit.failure(started)
+            raise
+        finally:
+            held.discard(host_class)
+            limit.release()
+
+    def report(self):
+        for limit in self._limits.values():
+            logging.info('Adaptive concurrency of %s: limit %d, cut %d times',
+                         limit.name, int(limit.limit), limit.decreases)
+
+    def _observe(self, reply, *args, **kwargs):
+        limit = self._limits[self.host_class(reply.url)]
+        latency = reply.elapsed.total_seconds()
+        if reply.status_code in self.OVERLOAD_STATUS_CODES:
+            limit.failure(time.time() - latency)
+        else:
+            limit.success(latency)
 
 
 class AbstractDownloader(object):
@@ -11,9 +339,11 @@ class AbstractDownloader(object):
     """
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, file_downloader):
+    def __init__(self, file_downloader, budget=None, controller=None):
         super(AbstractDownloader, self).__init__()
         self._file_downloader = file_downloader
+        self._budget = budget
+        self._controller = controller
 
     @abc.abstractmethod
     def download(self, *args, **kwargs):
@@ -29,11 +359,21 @@ class AbstractDownloader(object):
         catches all exceptions and returns the result.
         """
         try:
-            return url, self._file_downloader.download(url, *args, **kwargs)
+            # The adaptive slot comes first, threads waiting for it do
+            # not hold budget slots
+            with self._slot(url), \
+                    self._budget or contextlib.nullcontext():
+                return url, self._file_downloader.download(
+                    url, *args, **kwargs)
         except Exception as e:
             logging.error("AbstractDownloader: %s", traceback.format_exc())
             return url, e
 
+    def _slot(self, url):
+        if self._controller is None:
+            return contextlib.nullcontext()
+        return self._controller.slot(url)
+
 
 class ConsecutiveDownloader(AbstractDownloader):
     """
@@ -52,9 +392,14 @@ class ConsecutiveDownloader(AbstractDownloader):
 class ParallelDownloader(AbstractDownloader):
     """
     This class uses threading.Pool to run download requests in parallel.
+    With an adaptive controller (@see AdaptiveConcurrency), `processes` is
+    the maximum number of downloads and the controller decides how many of
+    them run.
     """
-    def __init__(self, file_downloader, processes=1):
-        super(ParallelDownloader, self).__init__(file_downloader)
+    def __init__(self, file_downloader, processes=1, budget=None,
+                 controller=None):
+        super(ParallelDownloader, self).__init__(
+            file_downloader, budget, controller)
         self._pool = Pool(processes=processes)
 
     def download(self, callback, url, *args, **kwargs):
@@ -0,0 +1,197 @@
+"""
+This module contains the model of a parsed course syllabus that is passed
+from extractors to the downloader: modules consist of sections, sections
+of lectures and lectures of downloadable resources.
+
+The model is built to stay small for specializations with tens of
+thousands of resources: all classes use __slots__, resources of a lecture
+are kept in a tuple instead of a dictionary of lists, and resource formats
+and URL hosts are interned so that every distinct value is stored once.
+"""
+
+import re
+import sys
+import itertools
+
+
+#: Version of the serialization format, @see to_json
+FORMAT_VERSION = 1
+
+HOST_REGEX = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://[^/?#]*')
+
+
+class Resource(object):
+    """
+    Downloadable resource of a lecture. The URL is stored as an interned
+    host part (scheme and network location) and the rest of the URL.
+    """
+    __slots__ = ('fmt', 'host', 'path', 'title', 'expiry')
+
+    def __init__(self, fmt, url, title, expiry=None):
+        """
+        @param fmt: Format of the resource (file extension), e.g. 'pdf'.
+        @type fmt: str
+
+        @param url: URL of the resource.
+        @type url: str
+
+        @param title: Title of the resource.
+        @type title: str
+
+        @param expiry: Expiry of a signed URL, @see api.make_url_expiry.
+        @type expiry: dict
+        """
+        match = HOST_REGEX.match(url)
+        host = match.group(0) if match else ''
+
+        self.fmt = sys.intern(fmt)
+        self.host = sys.intern(host)
+        self.path = url[len(host):]
+        self.title = title
+        self.expiry = expiry
+
+    @property
+    def url(self):
+        return self.host + self.path
+
+    def to_link(self):
+        """
+        Return the resource as a link tuple: (url, title) or
+        (url, title, expiry).
+
+        @rtype: tuple
+        """
+        if self.expiry is None:
+            return (self.url, self.title)
+        return (self.url, self.title, self.expiry)
+
+
+class Lecture(object):
+    """
+    Lecture with its resources, grouped by format.
+    """
+    __slots__ = ('slug', 'resources')
+
+    def __init__(self, slug, resources):
+        self.slug = slug
+        self.resources = tuple(resources)
+
+    @staticmethod
+    def from_links(slug, links):
+        """
+        Create a lecture from extracted links.
+
+        @param links: Links grouped by format, @see
+            CourseraOnDemand._extract_links_from_text
+        @type links: {str: [tuple]}
+
+        @rtype: Lecture
+        """
+        return Lecture(slug, [Resource(fmt, *link)
+                              for fmt, fmt_links in links.items()
+                              for link in fmt_links])
+
+    def groups(self):
+        """
+        Generate resources grouped by format in the order of extraction.
+
+        @rtype: generator of (str, [Resource])
+        """
+        for fmt, resources in itertools.groupby(
+                self.resources, lambda resource: resource.fmt):
+            yield fmt, list(resources)
+
+    def links(self):
+        """
+        Return resources as links grouped by format, the inverse of
+        from_links.
+
+        @rtype: {str: [tuple]}
+        """
+        return dict((fmt, [resource.to_link() for resource in resources])
+                    for fmt, resources in self.groups())
+
+
+class Section(object):
+    __slots__ = ('slug', 'lectures')
+
+    def __init__(self, slug, lectures):
+        self.slug = slug
+        self.lectures = lectures
+
+
+class Module(object):
+    __slots__ = ('slug', 'sections')
+
+    def __init__(self, slug, sections):
+        self.slug = slug
+        self.sections = sections
+
+
+def to_json(modules):
+    """
+    Serialize modules into a JSON compatible structure. Formats and hosts
+    are stored once in tables and referenced by index; the output only
+    depends on the modules, so equal syllabi serialize equally.
+
+    @param modules: Modules to serialize.
+    @type modules: [Module]
+
+    @rtype: dict
+    """
+    formats = {}
+    hosts = {}
+
+    def index(table, value):
+        return table.setdefault(value, len(table))
+
+    def resource_to_json(resource):
+        data = [index(formats, resource.fmt), index(hosts, resource.host),
+                resource.path, resource.title]
+        if resource.expiry is not None:
+            data.append(resource.expiry)
+        return data
+
+    data = [[module.slug,
+             [[section.slug,
+               [[lecture.slug, [resource_to_json(resource)
+                                for resource in lecture.resources]]
+                for lecture in section.lectures]]
+              for section in module.sections]]
+            for module in modules]
+
+    return {
+        'version': FORMAT_VERSION,
+        'formats': sorted(formats, key=formats.get),
+        'hosts': sorted(hosts, key=hosts.get),
+        'modules': data
+    }
+
+
+def from_json(data):
+    """
+    Deserialize modules, @see to_json.
+
+    @rtype: [Module]
+    @raise ValueError: If the data has an unknown format version.
+    """
+    if data.get('version') != FORMAT_VERSION:
+        raise ValueError('Unknown syllabus format version: %r' %
+                         data.get('version'))
+
+    formats = data['formats']
+    hosts = data['hosts']
+
+    def resource_from_json(resource):
+        fmt, host, path, title = resource[:4]
+        expiry = resource[4] if len(resource) > 4 else None
+        return Resource(formats[fmt], hosts[host] + path, title, expiry)
+
+    return [Module(module_slug,
+                   [Section(section_slug,
+                            [Lecture(lecture_slug,
+                                     [resource_from_json(resource)
+                                      for resource in resources])
+                             for lecture_slug, resources in lectures])
+                    for section_slug, lectures in sections])
+            for module_slug, sections in data['modules']]
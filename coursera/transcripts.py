@@ -0,0 +1,165 @@
+"""
+This module derives plain text transcripts of lectures from their
+subtitles, so that transcripts need not be downloaded separately.
+"""
+
+import re
+import codecs
+import logging
+import threading
+from multiprocessing.dummy import Pool
+
+import requests
+
+from .network import get_reply
+from .parallel import Counters
+from .utils import unescape_html
+
+
+TIMING_REGEX = re.compile(r'^\s*(\d+:)?\d+:\d+[.,]\d+\s*-->')
+TAG_REGEX = re.compile(r'<[^>]*>')
+CUE_SEPARATOR_REGEX = re.compile(r'\n\s*\n')
+
+
+def subtitles_to_text(subtitles):
+    """
+    Convert SubRip (srt) or WebVTT subtitles into a plain text transcript:
+    texts of all cues without numbers, timings and formatting tags.
+
+    @param subtitles: Contents of a subtitles file.
+    @type subtitles: str
+
+    @return: Transcript.
+    @rtype: str
+    """
+    subtitles = subtitles.replace('\r\n', '\n').replace('\r', '\n')
+
+    texts = []
+    for cue in CUE_SEPARATOR_REGEX.split(subtitles.strip()):
+        lines = cue.split('\n')
+        for index, line in enumerate(lines):
+            if TIMING_REGEX.match(line):
+                break
+        else:
+            # WebVTT header, NOTE and STYLE blocks have no timing
+            continue
+
+        text = ' '.join(lines[index + 1:])
+        text = unescape_html(TAG_REGEX.sub('', text))
+        texts.append(' '.join(text.split()))
+
+    return ' '.join(text for text in texts if text) + '\n'
+
+
+class TranscriptWriter(Counters):
+    """
+    Background stage that writes transcripts derived from subtitles.
+    Subtitles are converted as soon as their download completes; the
+    subtitles of transcripts that are still pending when the course is
+    done (e.g. because subtitles were filtered out) are fetched when the
+    writer is joined.
+    """
+
+    def __init__(self, session, jobs=1):
+        """
+        @param session: Requests session used to fetch subtitles that were
+            not downloaded.
+        @type session: requests.Session
+
+        @param jobs: Number of worker threads.
+        @type jobs: int
+        """
+        self._session = session
+        self._pool = Pool(processes=jobs)
+        self._lock = threading.Lock()
+        self._subtitles = {}
+        self._pending = {}
+
+        self.derived = 0
+        self.fetched = 0
+        self.failed = 0
+
+    def request(self, subtitles_url, filename):
+        """
+        Ask for the transcript of the given subtitles to be written.
+
+        @param subtitles_url: URL of the subtitles (srt or vtt).
+        @type subtitles_url: str
+
+        @param filename: Transcript file name.
+        @type filename: str
+        """
+        with self._lock:
+            subtitles_filename = self._subtitles.get(subtitles_url)
+            if subtitles_filename is None:
+                self._pending.setdefault(subtitles_url, []).append(filename)
+                return
+        self._convert(subtitles_filename, [filename])
+
+    def subtitles_available(self, subtitles_url, subtitles_filename):
+        """
+        Tell the writer that the subtitles have been saved to a file.
+        """
+        with self._lock:
+            self._subtitles[subtitles_url] = subtitles_filename
+            filenames = self._pending.pop(subtitles_url, None)
+        if filenames:
+            self._convert(subtitles_filename, filenames)
+
+    def join(self):
+        """
+        Write all requested transcripts and wait until they are written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for subtitles_url, filenames in pending.items():
+            self._pool.apply_async(self._fetch_and_write,
+                                   (subtitles_url, filenames))
+
+        self._pool.close()
+        self._pool.join()
+        logging.info('Transcripts: %d derived from subtitles, %d fetched, '
+                     '%d failed', self.derived, self.fetched, self.failed)
+
+    def _convert(self, subtitles_filename, filenames):
+        self._pool.apply_async(self._read_and_write,
+                               (subtitles_filename, filenames))
+
+    def _read_and_write(self, subtitles_filename, filenames):
+        try:
+            with codecs.open(subtitles_filename, 'r', 'utf-8-sig') \
+                    as file_object:
+                subtitles = file_object.read()
+        except (IOError, OSError, UnicodeDecodeError) as e:
+            logging.error('Could not read subtitles %s: %s',
+                          subtitles_filename, e)
+            self._count('failed')
+            return
+
+        self._write(subtitles, filenames, 'derived')
+
+    def _fetch_and_write(self, subtitles_url, filenames):
+        try:
+            reply = get_reply(self._session, subtitles_url, cache=False)
+        except requests.exceptions.RequestException as e:
+            logging.error('Could not fetch subtitles %s: %s',
+                          subtitles_url, e)
+            self._count('failed')
+            return
+
+        subtitles = reply.content.decode('utf-8-sig', 'replace')
+        self._write(subtitles, filenames, 'fetched')
+
+    def _write(self, subtitles, filenames, counter):
+        transcript = subtitles_to_text(subtitles)
+        for filename in filenames:
+            logging.info('Writing transcript: %s', filename)
+            try:
+                with codecs.open(filename, 'w', 'utf-8') as file_object:
+                    file_object.write(transcript)
+            except (IOError, OSError) as e:
+                logging.error('Could not write transcript %s: %s',
+                              filename, e)
+                self._count('failed')
+                continue
+            self._count(counter)
@@ -8,7 +8,6 @@ import os
 import re
 import sys
 import time
-import json
 import errno
 import random
 import string
@@ -17,6 +16,7 @@ import datetime
 
 
 from bs4 import BeautifulSoup as BeautifulSoup_
+from bs4.builder import builder_registry
 from xml.sax.saxutils import unescape as sax_unescape
 
 import html
@@ -27,22 +27,93 @@ from urllib.parse import urlparse, urljoin
 from string import ascii_letters as string_ascii_letters
 from string import digits as string_digits
 
+from . import jsoncodec
 from .define import COURSERA_URL, WINDOWS_UNC_PREFIX
 
-# Force us of bs4 with html.parser
+# HTML parsers that BeautifulSoup may use. 'html.parser' is always
+# available and is the reference for the generated HTML.
+HTML_PARSERS = ('lxml', 'html.parser')
 
+# Size in bytes from which 'auto' parses a page with lxml. Smaller pages
+# are parsed as fast or faster by html.parser, @see
+# benchmarks/check_html_parsers.py
+AUTO_LXML_MIN_SIZE = 4096
 
-def BeautifulSoup(page): return BeautifulSoup_(page, 'html.parser')
+_html_parser = 'html.parser'
+
+# Pages that already are complete documents keep their wrapper tags
+_HTML_DOCUMENT_REGEX = re.compile(r'<(html|head|body)[\s>]', re.IGNORECASE)
+
+
+def set_html_parser(name='auto'):
+    """
+    Select the parser backend of BeautifulSoup. 'auto' parses pages of at
+    least AUTO_LXML_MIN_SIZE bytes with lxml, if it is installed, and
+    smaller ones with 'html.parser'. Unavailable parsers fall back to
+    'html.parser'.
+
+    @param name: Parser name, one of HTML_PARSERS or 'auto'.
+    @type name: str
+
+    @return: Name of the selected parser.
+    @rtype: str
+    """
+    global _html_parser
+
+    if name == 'auto':
+        if builder_registry.lookup('lxml') is None:
+            name = 'html.parser'
+    elif builder_registry.lookup(name) is None:
+        logging.warning('HTML parser %s is not available, using '
+                        'html.parser', name)
+        name = 'html.parser'
+
+    _html_parser = name
+    logging.debug('Using HTML parser %s', name)
+    return name
+
+
+def get_html_parser():
+    """
+    Return the name of the selected parser backend ('auto' if it depends
+    on the page). Parsers may produce slightly different HTML, so stored
+    pages are keyed by it.
+
+    @rtype: str
+    """
+    return _html_parser
+
+
+def BeautifulSoup(page):
+    """
+    Parse an HTML page or fragment with the selected parser backend (see
+    set_html_parser). Parsers that wrap fragments into a complete document
+    (<html><head><body>) have the wrapper removed so that the tree matches
+    the one produced by html.parser.
+    """
+    parser = _html_parser
+    if parser == 'auto':
+        parser = 'lxml' if len(page) >= AUTO_LXML_MIN_SIZE \
+            else 'html.parser'
+
+    soup = BeautifulSoup_(page, parser)
+    if parser != 'html.parser' and \
+            not _HTML_DOCUMENT_REGEX.search(page):
+        for name in ('html', 'head', 'body'):
+            tag = soup.find(name)
+            if tag is not None:
+                tag.unwrap()
+    return soup
 
 
 def spit_json(obj, filename):
-    with open(filename, 'w') as file_object:
-        json.dump(obj, file_object, indent=4)
+    with open(filename, 'wb') as file_object:
+        jsoncodec.dump(obj, file_object, indent=True)
 
 
 def slurp_json(filename):
-    with open(filename) as file_object:
-        return json.load(file_object)
+    with open(filename, 'rb') as file_object:
+        return jsoncodec.load(file_object)
 
 
 def is_debug_run():
@@ -12,89 +12,125 @@ from .formatting import format_section, get_lecture_filename
 from .playlist import create_m3u_playlist
 from .utils import is_course_complete, mkdir_p, normalize_path
 from .filtering import find_resources_to_get, skip_format_url
-from .define import IN_MEMORY_MARKER
+from .define import (IN_MEMORY_MARKER, TRANSCRIPT_MARKER,
+                     SIGNED_URL_EXPIRY_MARGIN)
 
 
-def _iter_modules(modules, class_name, path, ignored_formats, args):
+class IterOptions(object):
     """
-    This huge function generates a hierarchy with hopefully more
-    clear structure of modules/sections/lectures.
+    Traversal options shared by the Iter* views of one course.
     """
-    file_formats = args.file_formats
-    lecture_filter = args.lecture_filter
-    resource_filter = args.resource_filter
-    section_filter = args.section_filter
-    verbose_dirs = args.verbose_dirs
-    combined_section_lectures_nums = args.combined_section_lectures_nums
-
-    class IterModule(object):
-        def __init__(self, index, module):
-            self.index = index
-            self.name = '%02d_%s' % (index + 1, module[0])
-            self._module = module
-
-        @property
-        def sections(self):
-            sections = self._module[1]
-            for (secnum, (section, lectures)) in enumerate(sections):
-                if section_filter and not re.search(section_filter, section):
-                    logging.debug('Skipping b/c of sf: %s %s',
-                                  section_filter, section)
-                    continue
-
-                yield IterSection(self, secnum, section, lectures)
-
-    class IterSection(object):
-        def __init__(self, module_iter, secnum, section, lectures):
-            self.index = secnum
-            self.name = '%02d_%s' % (secnum, section)
-            self.dir = os.path.join(
-                path, class_name, module_iter.name,
-                format_section(secnum + 1, section,
-                               class_name, verbose_dirs))
-            self._lectures = lectures
-
-        @property
-        def lectures(self):
-            for (lecnum, (lecname, lecture)) in enumerate(self._lectures):
-                if lecture_filter and not re.search(lecture_filter, lecname):
-                    logging.debug('Skipping b/c of lf: %s %s',
-                                  lecture_filter, lecname)
-                    continue
+    __slots__ = ('class_name', 'path', 'ignored_formats', 'file_formats',
+                 'lecture_filter', 'resource_filter', 'section_filter',
+                 'verbose_dirs', 'combined_section_lectures_nums')
+
+    def __init__(self, class_name, path, ignored_formats, args):
+        self.class_name = class_name
+        self.path = path
+        self.ignored_formats = ignored_formats
+        self.file_formats = args.file_formats
+        self.lecture_filter = args.lecture_filter
+        self.resource_filter = args.resource_filter
+        self.section_filter = args.section_filter
+        self.verbose_dirs = args.verbose_dirs
+        self.combined_section_lectures_nums = \
+            args.combined_section_lectures_nums
+
+
+class IterModule(object):
+    __slots__ = ('index', 'name', '_module', '_options')
+
+    def __init__(self, index, module, options):
+        self.index = index
+        self.name = '%02d_%s' % (index + 1, module.slug)
+        self._module = module
+        self._options = options
+
+    @property
+    def sections(self):
+        section_filter = self._options.section_filter
+        for (secnum, section) in enumerate(self._module.sections):
+            if section_filter and not re.search(section_filter,
+                                                section.slug):
+                logging.debug('Skipping b/c of sf: %s %s',
+                              section_filter, section.slug)
+                continue
+
+            yield IterSection(self, secnum, section, self._options)
+
+
+class IterSection(object):
+    __slots__ = ('index', 'name', 'dir', '_section', '_options')
+
+    def __init__(self, module_iter, secnum, section, options):
+        self.index = secnum
+        self.name = '%02d_%s' % (secnum, section.slug)
+        self.dir = os.path.join(
+            options.path, options.class_name, module_iter.name,
+            format_section(secnum + 1, section.slug,
+                           options.class_name, options.verbose_dirs))
+        self._section = section
+        self._options = options
+
+    @property
+    def lectures(self):
+        lecture_filter = self._options.lecture_filter
+        for (lecnum, lecture) in enumerate(self._section.lectures):
+            if lecture_filter and not re.search(lecture_filter,
+                                                lecture.slug):
+                logging.debug('Skipping b/c of lf: %s %s',
+                              lecture_filter, lecture.slug)
+                continue
+
+            yield IterLecture(self, lecnum, lecture, self._options)
+
+
+class IterLecture(object):
+    __slots__ = ('index', 'name', '_lecture', '_section_iter', '_options')
+
+    def __init__(self, section_iter, lecnum, lecture, options):
+        self.index = lecnum
+        self.name = lecture.slug
+        self._lecture = lecture
+        self._section_iter = section_iter
+        self._options = options
+
+    def filename(self, fmt, title):
+        lecture_filename = get_lecture_filename(
+            self._options.combined_section_lectures_nums,
+            self._section_iter.dir, self._section_iter.index,
+            self.index, self.name, title, fmt)
+        return lecture_filename
+
+    @property
+    def resources(self):
+        resources_to_get = find_resources_to_get(
+            self._lecture, self._options.file_formats,
+            self._options.resource_filter, self._options.ignored_formats)
+
+        for fmt, url, title, expiry in resources_to_get:
+            yield IterResource(fmt, url, title, expiry)
+
+
+class IterResource(object):
+    __slots__ = ('fmt', 'url', 'title', 'expiry')
+
+    def __init__(self, fmt, url, title, expiry=None):
+        self.fmt = fmt
+        self.url = url
+        self.title = title
+        self.expiry = expiry
 
-                yield IterLecture(self, lecnum, lecname, lecture)
-
-    class IterLecture(object):
-        def __init__(self, section_iter, lecnum, lecname, lecture):
-            self.index = lecnum
-            self.name = lecname
-            self._lecture = lecture
-            self._section_iter = section_iter
-
-        def filename(self, fmt, title):
-            lecture_filename = get_lecture_filename(
-                combined_section_lectures_nums,
-                self._section_iter.dir, self._section_iter.index,
-                self.index, self.name, title, fmt)
-            return lecture_filename
-
-        @property
-        def resources(self):
-            resources_to_get = find_resources_to_get(
-                self._lecture, file_formats, resource_filter,
-                ignored_formats)
-
-            for fmt, url, title in resources_to_get:
-                yield IterResource(fmt, url, title)
-
-    class IterResource(object):
-        def __init__(self, fmt, url, title):
-            self.fmt = fmt
-            self.url = url
-            self.title = title
 
+def _iter_modules(modules, class_name, path, ignored_formats, args):
+    """
+    Generate views of modules (@see syllabus.Module) that apply the
+    section, lecture and resource filters of the command line and know
+    where files of the course go.
+    """
+    options = IterOptions(class_name, path, ignored_formats, args)
     for index, module in enumerate(modules):
-        yield IterModule(index, module)
+        yield IterModule(index, module, options)
 
 
 def _walk_modules(modules, class_name, path, ignored_formats, args):
@@ -131,7 +167,20 @@ class CourseraDownloader(CourseDownloader):
                  class_name,
                  path='',
                  ignored_formats=None,
-                 disable_url_skipping=False):
+                 disable_url_skipping=False,
+                 url_refresher=None,
+                 transcript_writer=None):
+        """
+        @param url_refresher: Function that re-resolves expired signed
+            URLs, @see api.SignedURLRefresher. Expired URLs are downloaded
+            as is if it is not given.
+        @type url_refresher: callable([dict]) -> dict
+
+        @param transcript_writer: Background stage that writes transcripts
+            derived from subtitles (resources marked with
+            TRANSCRIPT_MARKER).
+        @type transcript_writer: transcripts.TranscriptWriter
+        """
         super(CourseraDownloader, self).__init__()
 
         self._downloader = downloader
@@ -140,6 +189,8 @@ class CourseraDownloader(CourseDownloader):
         self._path = path
         self._ignored_formats = ignored_formats
         self._disable_url_skipping = disable_url_skipping
+        self._url_refresher = url_refresher
+        self._transcript_writer = transcript_writer
 
         self.skipped_urls = None if disable_url_skipping else []
         self.failed_urls = []
@@ -156,8 +207,12 @@ class CourseraDownloader(CourseDownloader):
                 if not os.path.exists(section.dir):
                     mkdir_p(normalize_path(section.dir))
 
-                for lecture in section.lectures:
-                    for resource in lecture.resources:
+                lectures = [(lecture, list(lecture.resources))
+                            for lecture in section.lectures]
+                self._refresh_expired_urls(lectures)
+
+                for lecture, resources in lectures:
+                    for resource in resources:
                         lecture_filename = normalize_path(
                             lecture.filename(resource.fmt, resource.title))
                         last_update = self._handle_resource(
@@ -181,8 +236,56 @@ class CourseraDownloader(CourseDownloader):
 
         # Wait for all downloads to complete
         self._downloader.join()
+        if self._transcript_writer is not None:
+            self._transcript_writer.join()
         return completed
 
+    def _refresh_expired_urls(self, lectures):
+        """
+        Re-resolve signed URLs of a section that have expired (or are about
+        to) in a single batch, just before they are handed to the
+        downloader. Only resources that are going to be downloaded are
+        refreshed.
+
+        @param lectures: Lectures of a section along with their resources.
+        @type lectures: [(IterLecture, [IterResource])]
+        """
+        if self._url_refresher is None or self._args.skip_download:
+            return
+
+        deadline = (time.time() + SIGNED_URL_EXPIRY_MARGIN) * 1000
+        expired = []
+        for lecture, resources in lectures:
+            for resource in resources:
+                if resource.expiry is None or \
+                        resource.expiry['expires'] > deadline:
+                    continue
+                lecture_filename = normalize_path(
+                    lecture.filename(resource.fmt, resource.title))
+                if self._needs_download(lecture_filename):
+                    expired.append(resource)
+
+        if not expired:
+            return
+
+        logging.info('Refreshing %d expired URLs', len(expired))
+        refreshed = self._url_refresher(
+            [resource.expiry for resource in expired])
+
+        for resource in expired:
+            key = (resource.expiry['kind'], resource.expiry['asset_id'])
+            if key in refreshed:
+                url, expires = refreshed[key]
+                resource.url = url
+                resource.expiry = dict(resource.expiry, expires=expires)
+            else:
+                logging.warning('Could not refresh expired URL %s',
+                                resource.url)
+
+    def _needs_download(self, lecture_filename):
+        return (self._args.overwrite or self._args.resume or
+                not os.path.exists(lecture_filename))
+
     def _download_completion_handler(self, url, result):
         if isinstance(result, requests.exceptions.RequestException):
             logging.error('The following error has occurred while '
@@ -216,14 +319,22 @@ class CourseraDownloader(CourseDownloader):
         @return: Updated latest mtime.
         @rtype: int
         """
-        overwrite = self._args.overwrite
         resume = self._args.resume
         skip_download = self._args.skip_download
 
+        # Subtitles may be needed for transcripts derived from them
+        if self._transcript_writer is not None and \
+                not skip_download and fmt.endswith('.srt'):
+            callback = self._make_subtitles_handler(url, lecture_filename,
+                                                    callback)
+
         # Decide whether we need to download it
-        if overwrite or not os.path.exists(lecture_filename) or resume:
+        if self._needs_download(lecture_filename):
             if not skip_download:
-                if url.startswith(IN_MEMORY_MARKER):
+                if url.startswith(TRANSCRIPT_MARKER):
+                    self._transcript_writer.request(
+                        url[len(TRANSCRIPT_MARKER):], lecture_filename)
+                elif url.startswith(IN_MEMORY_MARKER):
                     page_content = url[len(IN_MEMORY_MARKER):]
                     logging.info('Saving page contents to: %s',
                                  lecture_filename)
@@ -241,12 +352,29 @@ class CourseraDownloader(CourseDownloader):
             last_update = time.time()
         else:
             logging.info('%s already downloaded', lecture_filename)
+            if self._transcript_writer is not None and \
+                    not skip_download and fmt.endswith('.srt'):
+                self._transcript_writer.subtitles_available(
+                    url, lecture_filename)
             # if this file hasn't been modified in a long time,
             # record that time
             last_update = max(last_update,
                               os.path.getmtime(lecture_filename))
         return last_update
 
+    def _make_subtitles_handler(self, url, lecture_filename, callback):
+        """
+        Wrap a download completion handler so that the transcript writer
+        learns about successfully downloaded subtitles.
+        """
+        def handler(download_url, result):
+            callback(download_url, result)
+            if not isinstance(result, Exception):
+                self._transcript_writer.subtitles_available(
+                    url, lecture_filename)
+
+        return handler
+
     def _run_hooks(self, section, hooks):
         original_dir = os.getcwd()
         for hook in hooks: